@@ -0,0 +1,117 @@
+# answer_cache.py
+import threading
+import zlib
+from collections import OrderedDict
+import numpy as np
+from search import tokenize
+
+# Words that don't change what is being asked, dropped before comparing
+# questions by similarity (but kept for the exact-match key)
+STOPWORDS = frozenset(
+    "a an and are can could do does for how i in is it me my of on or "
+    "please should the there to what where which with would you".split()
+)
+VECTOR_SIZE = 2 ** 12
+
+
+def normalize(message: str) -> str:
+    return ' '.join(tokenize(message))
+
+
+def _features(message: str) -> list:
+    words = [word for word in tokenize(message) if word not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def term_vector(message: str) -> np.ndarray:
+    """Hashed term frequencies of the message's words and word pairs."""
+    vector = np.zeros(VECTOR_SIZE, dtype=np.float32)
+    for feature in _features(message):
+        vector[zlib.crc32(feature.encode('utf-8')) % VECTOR_SIZE] += 1
+    return np.log1p(vector, out=vector)
+
+
+class AnswerCache:
+    """LRU of assistant answers to first messages, looked up by normalized
+    text and, failing that, by TF-IDF cosine similarity to the cached
+    questions. Each answer keeps the digest of the inventory context it was
+    grounded on; it is only served while the question still retrieves the
+    same context, so unrelated item edits don't evict it."""
+
+    def __init__(self, max_entries: int = 256, similarity: float = 0.9):
+        # 0 (or less) disables the cache
+        self.max_entries = max(max_entries, 0)
+        self.similarity = similarity
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalized text -> (answer, digest, slot)
+        self._vectors = np.zeros((self.max_entries, VECTOR_SIZE), dtype=np.float32)
+        self._document_frequency = np.zeros(VECTOR_SIZE, dtype=np.float32)
+        self._free_slots = list(range(self.max_entries))
+
+    def _similar(self, vector: np.ndarray):
+        if not self._entries or not vector.any():
+            return None
+        keys = list(self._entries)
+        slots = [self._entries[key][2] for key in keys]
+        idf = np.log((1 + len(keys)) / (1 + self._document_frequency)) + 1
+        matrix = self._vectors[slots] * idf
+        query = vector * idf
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        scores = np.divide(matrix @ query, norms, out=np.zeros(len(keys), dtype=np.float32),
+                           where=norms > 0)
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity else None
+
+    def get(self, message: str, digest):
+        if not self.max_entries:
+            return None
+        key = normalize(message)
+        with self._lock:
+            similar = False
+            if key not in self._entries and self.similarity and self.similarity > 0:
+                key = self._similar(term_vector(message))
+                similar = key is not None
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != digest:
+                # A stale answer is left for put() to replace or the LRU to drop
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.similar_hits += similar
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, message: str, digest, answer: str) -> None:
+        key = normalize(message)
+        if not key or not answer or not self.max_entries:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if not self._free_slots:
+                self._remove(next(iter(self._entries)))
+            slot = self._free_slots.pop()
+            vector = term_vector(message)
+            self._vectors[slot] = vector
+            self._document_frequency += vector > 0
+            self._entries[key] = (answer, digest, slot)
+
+    def _remove(self, key) -> None:
+        slot = self._entries.pop(key)[2]
+        self._document_frequency -= self._vectors[slot] > 0
+        self._vectors[slot] = 0
+        self._free_slots.append(slot)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
@@ -10,8 +10,17 @@ migrate = Migrate()
 def create_app():
     app = Flask(__name__)
 
+    from uploads import StreamingUploadRequest
+    app.request_class = StreamingUploadRequest
+
     UPLOAD_FOLDER = 'static/thumbnails'
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    # Uploads in progress are written here, outside the served static folder
+    app.config['UPLOAD_STAGING_FOLDER'] = (os.environ.get("UPLOAD_STAGING_FOLDER")
+                                           or os.path.join(app.instance_path, 'uploads'))
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_CONTENT_LENGTH", 16 * 1024 * 1024))
+    app.config['UPLOAD_WORKERS'] = int(os.environ.get("UPLOAD_WORKERS", 2))
+    app.config['EVENTS_BACKEND'] = os.environ.get("EVENTS_BACKEND", "local")
     app.secret_key = os.environ.get("FLASK_SECRET_KEY") or "a secret key"
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
@@ -22,6 +31,12 @@ def create_app():
     db.init_app(app)
     migrate.init_app(app, db)
 
+    import events
+    events.init_app(app)
+
+    import assets
+    assets.init_app(app)
+
     from routes import main_blueprint
     app.register_blueprint(main_blueprint)
 
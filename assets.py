@@ -0,0 +1,174 @@
+# assets.py
+import gzip
+import json
+import mimetypes
+import os
+import shutil
+import threading
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+import blobstore
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# Uploads, processed models and map tiles are served by their own routes
+SKIP_DIRS = {DIST_DIR, 'thumbnails', 'models', 'tiles'}
+COMPRESSIBLE = {'.css', '.js', '.svg', '.gltf', '.json', '.html', '.txt'}
+# Preferred first; brotli only when the module is installed
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def fingerprinted_name(relative_path: str, digest: str) -> str:
+    stem, extension = os.path.splitext(relative_path)
+    return f"{stem}.{digest[:12]}{extension}"
+
+
+def _write_compressed(path: str, data: bytes) -> list:
+    """Write .gz (and .br) siblings of path when they are smaller."""
+    written = []
+    candidates = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    brotli = _brotli()
+    if brotli:
+        candidates.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in candidates:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+def build(static_folder: str) -> dict:
+    """Copy every static asset to dist/ under a content-hashed name, with
+    precompressed siblings for text assets, and write the manifest mapping
+    original paths to fingerprinted ones. Returns the manifest."""
+    dist = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    keep = {os.path.join(dist, MANIFEST_NAME)}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in files:
+            source = os.path.join(root, name)
+            relative_path = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            target_name = fingerprinted_name(relative_path, blobstore.file_digest(source))
+            target = os.path.join(dist, target_name)
+            keep.add(target)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+                if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+                    with open(source, 'rb') as f:
+                        _write_compressed(target, f.read())
+            keep.update(target + suffix for _, suffix in ENCODINGS
+                        if os.path.exists(target + suffix))
+            manifest[relative_path] = target_name
+
+    # Drop builds of files that have since changed
+    for root, _, files in os.walk(dist):
+        for name in files:
+            path = os.path.join(root, name)
+            if path not in keep:
+                os.remove(path)
+    manifest_path = os.path.join(dist, MANIFEST_NAME)
+    with open(manifest_path + '.part', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.part', manifest_path)
+    return manifest
+
+
+class AssetManifest:
+    """The built manifest, reloaded when the file changes. Without a build
+    every asset resolves to its plain /static URL."""
+
+    def __init__(self):
+        self._entries = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _load(self, static_folder: str) -> dict:
+        path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                entries = {}
+                if mtime is not None:
+                    try:
+                        with open(path) as f:
+                            entries = json.load(f)
+                    except (OSError, ValueError) as e:
+                        current_app.logger.warning(f"Ignoring unreadable asset manifest: {str(e)}")
+                self._entries = entries
+                self._mtime = mtime
+            return self._entries
+
+    def version(self, static_folder: str):
+        self._load(static_folder)
+        return self._mtime
+
+    def url(self, static_folder: str, path: str) -> str:
+        relative_path = path.lstrip('/')
+        if relative_path.startswith('static/'):
+            relative_path = relative_path[len('static/'):]
+        built = self._load(static_folder).get(relative_path)
+        if built:
+            return f"/static/{DIST_DIR}/{built}"
+        return f"/static/{relative_path}"
+
+
+manifest = AssetManifest()
+
+
+def asset_url(path: str) -> str:
+    """Template helper: the fingerprinted URL of a static asset."""
+    return manifest.url(current_app.static_folder, path)
+
+
+def send_fingerprinted(filename: str):
+    """Serve a built asset for a year as immutable, picking a precompressed
+    sibling the client accepts."""
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    mimetype = None
+    encoding = None
+    path = filename
+    for candidate, suffix in ENCODINGS:
+        compressed = safe_join(dist, filename + suffix)
+        if candidate in request.accept_encodings and compressed and os.path.isfile(compressed):
+            encoding = candidate
+            path = filename + suffix
+            # Typed as the original file, not as .br/.gz
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            break
+    response = send_from_directory(dist, path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app) -> None:
+    app.add_template_global(asset_url)
+
+
+if __name__ == "__main__":
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        built = build(app.static_folder)
+        print(f"Fingerprinted {len(built)} assets into {os.path.join(app.static_folder, DIST_DIR)}")
@@ -0,0 +1,154 @@
+# blobstore.py
+import errno
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+from flask import current_app, has_app_context
+from models import Item
+from images import delete_variants
+
+CHUNK_SIZE = 64 * 1024
+# Blobs touched more recently than this are never collected, so an upload
+# that has stored its bytes but not yet committed its Item row is safe.
+# Releases that land inside the grace period are retried once it is over.
+GC_GRACE_SECONDS = 60
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+
+def normalize_extension(filename: Optional[str]) -> str:
+    _, extension = os.path.splitext(filename or '')
+    extension = extension.lower()
+    return EXTENSION_ALIASES.get(extension, extension)
+
+
+def is_blob(filename: str) -> bool:
+    return bool(BLOB_NAME.match(filename))
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _move_into_place(source: str, target: str) -> None:
+    try:
+        os.replace(source, target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Staged on another filesystem: copy alongside the target, then rename
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out, open(source, 'rb') as f:
+                shutil.copyfileobj(f, out, CHUNK_SIZE)
+            os.replace(tmp_path, target)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        os.remove(source)
+
+
+def _commit(tmp_path: str, digest: str, extension: str, upload_folder: str) -> tuple:
+    filename = f"{digest}{extension}"
+    blob_path = os.path.join(upload_folder, filename)
+    if os.path.exists(blob_path):
+        os.remove(tmp_path)
+        os.utime(blob_path)
+        return filename, False
+    _move_into_place(tmp_path, blob_path)
+    return filename, True
+
+
+def store_file(path: str, extension: str, upload_folder: str) -> tuple:
+    """Move a file that is already on disk (typically in the staging
+    folder) into the store.
+
+    Returns (filename, created) where created is False when identical
+    bytes were already stored."""
+    return _commit(path, file_digest(path), extension, upload_folder)
+
+
+def reference_count(image_path: str) -> int:
+    return Item.query.filter_by(image_path=image_path).count()
+
+
+# (upload_folder, image_path) -> time the release can be retried
+_deferred = {}
+_deferred_lock = threading.Lock()
+
+
+def release(image_path: Optional[str], upload_folder: str) -> bool:
+    """Delete the blob behind image_path (and its thumbnails) once no Item
+    references it any more. Call after the session has been committed."""
+    retry_deferred(upload_folder)
+    return _release(image_path, upload_folder)
+
+
+def _release(image_path: Optional[str], upload_folder: str) -> bool:
+    if not image_path:
+        return False
+    filename = os.path.basename(image_path)
+    if not is_blob(filename) or reference_count(image_path) > 0:
+        return False
+    if collect(filename, upload_folder):
+        return True
+    _defer(image_path, upload_folder)
+    return False
+
+
+def _defer(image_path: str, upload_folder: str) -> None:
+    """Queue a release skipped for the grace period. A timer retries it
+    when the period is over; any later release() also picks it up, in case
+    the process went away first."""
+    try:
+        due = os.path.getmtime(os.path.join(upload_folder, os.path.basename(image_path))) + GC_GRACE_SECONDS
+    except FileNotFoundError:
+        return
+    with _deferred_lock:
+        _deferred[(upload_folder, image_path)] = due
+    if has_app_context():
+        timer = threading.Timer(max(due - time.time(), 0) + 1, _retry_in_app,
+                                (current_app._get_current_object(), upload_folder))
+        timer.daemon = True
+        timer.start()
+
+
+def _retry_in_app(app, upload_folder: str) -> None:
+    with app.app_context():
+        try:
+            retry_deferred(upload_folder)
+        except Exception as e:
+            app.logger.error(f"Retrying deferred blob releases failed: {str(e)}")
+
+
+def retry_deferred(upload_folder: str) -> int:
+    """Release queued blobs whose grace period is over. Ones referenced
+    again in the meantime are kept. Returns how many were deleted."""
+    now = time.time()
+    with _deferred_lock:
+        due = [image_path for (folder, image_path), at in _deferred.items()
+               if folder == upload_folder and at <= now]
+        for image_path in due:
+            del _deferred[(upload_folder, image_path)]
+    return sum(_release(image_path, upload_folder) for image_path in due)
+
+
+def collect(filename: str, upload_folder: str) -> bool:
+    blob_path = os.path.join(upload_folder, filename)
+    try:
+        if time.time() - os.path.getmtime(blob_path) < GC_GRACE_SECONDS:
+            return False
+        os.remove(blob_path)
+    except FileNotFoundError:
+        return False
+    delete_variants(filename, upload_folder)
+    return True
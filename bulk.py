@@ -0,0 +1,250 @@
+# bulk.py
+import csv
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import zipfile
+from sqlalchemy import delete, insert, update
+from werkzeug.utils import secure_filename
+from app import db
+from models import Item, ItemTombstone, Map, item_tags, utcnow
+from sync import next_revision
+from tags import link_item_tags
+import blobstore
+
+FORMATS = ('csv', 'json', 'jsonl')
+MAX_ROWS = 5000
+EXPORT_BATCH_SIZE = 500
+EXPORT_FIELDS = ('id', 'name', 'tags', 'color', 'zone', 'quantity', 'warning',
+                 'x_coord', 'y_coord', 'map_id', 'description', 'link', 'image_path')
+DEFAULTS = {'tags': '', 'color': 'red', 'zone': '', 'quantity': 1, 'warning': '',
+            'description': '', 'link': ''}
+MAX_LENGTHS = {'name': 100, 'tags': 200, 'color': 20, 'zone': 100, 'warning': 255, 'link': 500}
+UPDATE_FIELDS = {'name': str, 'tags': str, 'color': str, 'zone': str, 'warning': str,
+                 'description': str, 'link': str, 'quantity': int, 'x_coord': float,
+                 'y_coord': float, 'map_id': int}
+
+
+class TooManyRowsError(ValueError):
+    pass
+
+
+def detect_format(filename: str, requested=None) -> str:
+    fmt = (requested or os.path.splitext(filename or '')[1].lstrip('.')).lower()
+    fmt = {'ndjson': 'jsonl'}.get(fmt, fmt)
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format '{fmt}', expected one of {', '.join(FORMATS)}")
+    return fmt
+
+
+def read_rows(stream, fmt: str) -> list:
+    """Parse an uploaded CSV, JSON array or JSON Lines document into dicts.
+    Raises ValueError when the document itself is malformed."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            rows = list(csv.DictReader(text))
+        elif fmt == 'json':
+            rows = json.load(text)
+            if not isinstance(rows, list):
+                raise ValueError("expected a JSON array of items")
+        else:
+            rows = [json.loads(line) for line in text if line.strip()]
+    except (UnicodeDecodeError, json.JSONDecodeError, csv.Error) as e:
+        raise ValueError(f"could not parse {fmt}: {str(e)}")
+    finally:
+        text.detach()
+    return check_row_count(rows)
+
+
+def check_row_count(rows: list, action: str = 'imported') -> list:
+    """The same limit for every import format, JSON bodies included, and
+    for batch updates."""
+    if len(rows) > MAX_ROWS:
+        raise TooManyRowsError(f"at most {MAX_ROWS} items can be {action} at once")
+    return rows
+
+
+def validate_row(row, map_ids: set, default_map_id=None) -> tuple:
+    """Return (values, errors) for one imported row. values is ready to be
+    inserted into the item table; errors lists what is wrong with it."""
+    if not isinstance(row, dict):
+        return None, ["expected an object"]
+    # Blank CSV cells count as missing
+    row = {key: value for key, value in row.items() if key and value not in (None, '')}
+    errors = []
+    values = dict(DEFAULTS)
+    for field in ('name', 'tags', 'color', 'zone', 'warning', 'description', 'link'):
+        if field in row:
+            values[field] = str(row[field]).strip()
+    if not values.get('name'):
+        errors.append("name is required")
+    for field, limit in MAX_LENGTHS.items():
+        if len(values.get(field) or '') > limit:
+            errors.append(f"{field} is longer than {limit} characters")
+
+    for field in ('x_coord', 'y_coord'):
+        try:
+            values[field] = float(row[field])
+            if not math.isfinite(values[field]):
+                raise ValueError
+        except KeyError:
+            errors.append(f"{field} is required")
+        except (TypeError, ValueError):
+            errors.append(f"{field} must be a number")
+    try:
+        values['quantity'] = int(row.get('quantity', DEFAULTS['quantity']))
+    except (TypeError, ValueError):
+        errors.append("quantity must be an integer")
+    try:
+        values['map_id'] = int(row.get('map_id', default_map_id))
+        if values['map_id'] not in map_ids:
+            errors.append(f"map {values['map_id']} does not exist")
+    except (TypeError, ValueError):
+        errors.append("map_id is required" if row.get('map_id') is None else "map_id must be an integer")
+
+    image = row.get('image')
+    if image is not None:
+        values['image'] = str(image)
+    return values, errors
+
+
+def insert_items(rows: list) -> tuple:
+    """Insert validated rows in the current transaction with one executemany
+    and return (ids, revision), ids in row order. Tags are linked the same
+    way; the caller commits."""
+    session = db.session
+    revision = next_revision(session)
+    records = [{**{key: value for key, value in row.items() if key != 'image'}, 'revision': revision}
+               for row in rows]
+    ids = session.scalars(insert(Item).returning(Item.id, sort_by_parameter_order=True),
+                          records).all()
+    link_item_tags(session, {item_id: row['tags'] for item_id, row in zip(ids, rows)})
+    return ids, revision
+
+
+def expand_updates(payload) -> list:
+    """Accept either a list of {"id": ..., field: value} changes (also under
+    "items") or {"ids": [...], "set": {field: value}} for a selection."""
+    if isinstance(payload, dict) and 'ids' in payload:
+        changes = payload.get('set')
+        if not isinstance(payload['ids'], list) or not isinstance(changes, dict):
+            raise ValueError('expected "ids" as a list and "set" as an object')
+        # Checked before expanding, so a huge selection isn't copied first
+        check_row_count(payload['ids'], 'updated')
+        return [dict(changes, id=item_id) for item_id in payload['ids']]
+    if isinstance(payload, dict):
+        payload = payload.get('items')
+    if not isinstance(payload, list):
+        raise ValueError('expected a list of item updates')
+    return check_row_count(payload, 'updated')
+
+
+def validate_update(row, map_ids: set) -> tuple:
+    """Return (values, errors) for one partial update. values always has
+    the item id and only the fields being changed."""
+    if not isinstance(row, dict):
+        return None, ["expected an object"]
+    errors = []
+    try:
+        values = {'id': int(row['id'])}
+    except KeyError:
+        return None, ["id is required"]
+    except (TypeError, ValueError):
+        return None, ["id must be an integer"]
+    for field, value in row.items():
+        if field == 'id':
+            continue
+        kind = UPDATE_FIELDS.get(field)
+        if kind is None:
+            errors.append(f"{field} cannot be updated")
+            continue
+        try:
+            values[field] = kind(value.strip() if isinstance(value, str) else value)
+            if kind is float and not math.isfinite(values[field]):
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append(f"{field} must be {'a number' if kind is float else 'an integer'}")
+            continue
+        if field in MAX_LENGTHS and len(values[field]) > MAX_LENGTHS[field]:
+            errors.append(f"{field} is longer than {MAX_LENGTHS[field]} characters")
+    if 'name' in values and not values['name']:
+        errors.append("name cannot be empty")
+    if 'map_id' in values and values['map_id'] not in map_ids:
+        errors.append(f"map {values['map_id']} does not exist")
+    return values, errors
+
+
+def current_map_ids(item_ids) -> dict:
+    return dict(db.session.query(Item.id, Item.map_id).filter(Item.id.in_(list(item_ids))))
+
+
+def update_items(updates: list, previous_map_ids: dict) -> int:
+    """Apply validated partial updates in the current transaction and
+    return the revision they were stamped with. Rows are grouped by the
+    fields they change and each group is one executemany UPDATE by primary
+    key. previous_map_ids maps each item id to its map before the update."""
+    session = db.session
+    revision = next_revision(session)
+    now = utcnow()
+    session.execute(update(Item), [dict(values, revision=revision, updated_at=now)
+                                   for values in updates])
+
+    moved = [{"item_id": values['id'], "map_id": previous_map_ids[values['id']], "revision": revision,
+              "deleted_at": now}
+             for values in updates
+             if values.get('map_id', previous_map_ids[values['id']]) != previous_map_ids[values['id']]]
+    if moved:
+        # Same as sync.stamp_item_revisions: the item leaves its old map
+        session.execute(insert(ItemTombstone), moved)
+
+    retagged = {values['id']: values['tags'] for values in updates if 'tags' in values}
+    if retagged:
+        session.execute(delete(item_tags).where(item_tags.c.item_id.in_(list(retagged))))
+        link_item_tags(session, retagged)
+    return revision
+
+
+def existing_map_ids() -> set:
+    return {map_id for map_id, in db.session.query(Map.id)}
+
+
+def extract_image(archive: zipfile.ZipFile, name: str, staging_folder: str, max_size: int):
+    """Copy one member of the uploaded image zip to a temp file in the
+    staging folder. Returns (path, extension), or raises ValueError."""
+    try:
+        info = archive.getinfo(name)
+    except KeyError:
+        raise ValueError(f"image '{name}' is not in the zip")
+    if info.file_size > max_size:
+        raise ValueError(f"image '{name}' is too large")
+    fd, path = tempfile.mkstemp(dir=staging_folder, suffix='.part')
+    with os.fdopen(fd, 'wb') as out, archive.open(info) as member:
+        shutil.copyfileobj(member, out, blobstore.CHUNK_SIZE)
+    return path, blobstore.normalize_extension(secure_filename(os.path.basename(name)))
+
+
+def export_rows(map_id, fmt: str):
+    """Yield the map's items (or every item) as CSV or JSON Lines chunks,
+    reading them from the database in batches."""
+    query = db.session.query(*(getattr(Item, field) for field in EXPORT_FIELDS)).order_by(Item.id)
+    if map_id is not None:
+        query = query.filter(Item.map_id == map_id)
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        for count, row in enumerate(query.yield_per(EXPORT_BATCH_SIZE), 1):
+            writer.writerow(row)
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for row in query.yield_per(EXPORT_BATCH_SIZE):
+            yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n'
@@ -0,0 +1,82 @@
+# cache.py
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import current_app, request
+
+ALL_ITEMS = 'all'
+MAPS = 'maps'
+MARKERS = 'markers'
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def get_version(scope) -> int:
+    with _versions_lock:
+        return _versions.get(scope, 0)
+
+
+def bump_version(*scopes) -> None:
+    with _versions_lock:
+        for scope in set(scopes):
+            if scope is not None:
+                _versions[scope] = _versions.get(scope, 0) + 1
+
+
+def bump_map_version(*map_ids) -> None:
+    """Invalidate everything cached for the given maps (and the all-items
+    listings). Call after every committed item create/update/delete."""
+    bump_version(*map_ids, ALL_ITEMS)
+
+
+class ResponseCache:
+    """LRU of serialized JSON bodies, each tagged with the version of the
+    scope it was built from."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key, version, body: bytes, etag: str) -> None:
+        with self._lock:
+            self._entries[key] = (version, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def cached_json_response(key, scope, build, serialize=None, mimetype='application/json'):
+    """Serve build() as JSON with a strong ETag, answering If-None-Match with
+    304 and reusing the serialized bytes until the scope's version changes.
+    Pass serialize (returning bytes) and mimetype for another encoding."""
+    version = get_version(scope)
+    cached = response_cache.get(key, version)
+    if cached is None:
+        data = build()
+        body = serialize(data) if serialize else current_app.json.dumps(data).encode('utf-8')
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        response_cache.put(key, version, body, etag)
+    else:
+        body, etag = cached
+
+    response = current_app.response_class(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
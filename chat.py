@@ -1,11 +1,35 @@
 from openai import OpenAI
+import hashlib
 import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from models import Item
 from flask import current_app, jsonify
-from utils import list_available_items
+from answer_cache import AnswerCache
+from retrieval import relevant_items
 
 client = OpenAI()
 
+ASSISTANT_ID = os.environ.get("OPENAI_ASSISTANT_ID", "asst_42fSiwjxCUq9i93OpVATPcSn")
+# How many matching items are passed to each run
+CONTEXT_ITEMS = int(os.environ.get("CHAT_CONTEXT_ITEMS", 8))
+RUN_TIMEOUT = float(os.environ.get("CHAT_RUN_TIMEOUT", 60))
+POLL_INITIAL_DELAY = 0.25
+POLL_MAX_DELAY = 2.0
+FAILED_RUN_STATUSES = {'failed', 'cancelled', 'expired', 'incomplete', 'requires_action'}
+FAILED_RUN_EVENTS = {'thread.run.failed', 'thread.run.cancelled', 'thread.run.expired',
+                     'thread.run.incomplete', 'thread.run.requires_action', 'error'}
+
+# Streaming runs are read on these threads so a request only waits on a queue
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("CHAT_WORKERS", 4)),
+                               thread_name_prefix='chat')
+
+class ChatError(Exception):
+    pass
+
 # system prompt
 system_prompt = ("""
 Provide guidance on using specific tools within the Innovation Lab.
@@ -22,53 +46,268 @@ Deliver the guidance in a structured paragraph format and bullet points. Keep yo
 # Notes
 
 - When possible, prefer these software tools: Adobe Illustrator, Adobe Photoshop, OnShape, Simplify3d, Preform, tinkercad
-- Below are the available resources within the iLab. Limit your responses to focus on these items:
+- Each message comes with the iLab items most relevant to it and where they are. Limit your responses to focus on these items, and say where to find them when it helps.
 """)
 
-def get_available_items_text():
-    with current_app.app_context():
-        items = list_available_items()
-    return str(items)  # Convert the items list to string
+def encode_inventory(items) -> str:
+    """One line per item, "name | tags | location | description", with
+    trailing empty fields dropped. Much shorter than the repr of a list of
+    dicts."""
+    lines = []
+    for item in items:
+        location = f"{item['map_name']}, zone {item['zone']}" if item.get('zone') else item['map_name']
+        location += f" at ({item['x_coord']:.0f}, {item['y_coord']:.0f})"
+        fields = [' '.join(str(value or '').split())
+                  for value in (item["name"], item.get("tags"), location, item.get("description"))]
+        while fields and not fields[-1]:
+            fields.pop()
+        lines.append(' | '.join(fields))
+    return "Relevant items (name | tags | location | description):\n" + '\n'.join(lines)
 
-# Initialize with an empty string, we'll update it within the application context
-available_items_text = ""
+def grounding_context(user_message: str) -> str:
+    """The inventory a run gets to see: only the items that match the
+    message, so the prompt stays the same size as the catalogue grows."""
+    items = relevant_items(user_message, CONTEXT_ITEMS)
+    if not items:
+        return "No iLab items matched this message."
+    return encode_inventory(items)
+
+def context_digest(context: str) -> str:
+    return hashlib.sha256(context.encode('utf-8')).hexdigest()
 
 assistant = None
 
 def initialize_assistant():
-    global assistant, available_items_text
-    available_items_text = get_available_items_text()
-    assistant = client.beta.assistants.update("asst_42fSiwjxCUq9i93OpVATPcSn",
-        instructions=system_prompt + available_items_text
-    )
-
-def get_ai_response(user_message: str) -> str:
-    global available_items_text
+    global assistant
+    assistant = client.beta.assistants.update(ASSISTANT_ID, instructions=system_prompt)
+    warm_threads.refill()
 
+def ensure_assistant():
     if assistant is None:
         initialize_assistant()
 
-    # Update available items before each response
-    # available_items_text = get_available_items_text()
+class ThreadStore:
+    """Maps a browser's chat session to its OpenAI thread, so follow-up
+    questions keep their context. Least recently used entries are dropped
+    past `max_entries`, and idle ones after `ttl` seconds."""
 
-    thread = client.beta.threads.create()
-    client.beta.threads.messages.create(
-        thread_id=thread.id,
-        role='user',
-        content=user_message
-    )
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._threads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_key):
+        with self._lock:
+            entry = self._threads.get(session_key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] > self.ttl:
+                del self._threads[session_key]
+                return None
+            self._threads[session_key] = (entry[0], time.monotonic())
+            self._threads.move_to_end(session_key)
+            return entry[0]
+
+    def put(self, session_key, thread_id: str) -> None:
+        with self._lock:
+            self._threads[session_key] = (thread_id, time.monotonic())
+            self._threads.move_to_end(session_key)
+            while len(self._threads) > self.max_entries:
+                self._threads.popitem(last=False)
+
+    def discard(self, session_key) -> None:
+        with self._lock:
+            self._threads.pop(session_key, None)
+
+
+class WarmThreads:
+    """A few empty threads created ahead of time, so a first message can
+    start its run straight away. Disabled when size is 0."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._threads = []
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            thread_id = self._threads.pop() if self._threads else None
+        self.refill()
+        return thread_id
+
+    def refill(self) -> None:
+        with self._lock:
+            missing = self.size - len(self._threads) - self._pending
+            self._pending += max(missing, 0)
+        for _ in range(missing):
+            _executor.submit(self._create)
+
+    def _create(self) -> None:
+        thread_id = None
+        try:
+            thread_id = client.beta.threads.create().id
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if thread_id:
+                    self._threads.append(thread_id)
+
+
+thread_store = ThreadStore(max_entries=int(os.environ.get("CHAT_MAX_THREADS", 1000)),
+                           ttl=float(os.environ.get("CHAT_THREAD_TTL", 3600)))
+warm_threads = WarmThreads(size=int(os.environ.get("CHAT_WARM_THREADS", 0)))
+# CHAT_CACHE_SIMILARITY=0 turns off matching of reworded questions
+answer_cache = AnswerCache(max_entries=int(os.environ.get("CHAT_CACHE_SIZE", 256)),
+                           similarity=float(os.environ.get("CHAT_CACHE_SIMILARITY", 0.9)))
+
+def acquire_thread(session_key=None) -> tuple:
+    """Return (thread_id, history) for the session's conversation, starting
+    one from the warm pool (or a fresh thread) when it has none. history
+    holds earlier turns that were answered from the cache and still need
+    to be sent along with the next run."""
+    stored = thread_store.get(session_key) if session_key else None
+    if isinstance(stored, str):
+        return stored, []
+    thread_id = warm_threads.take() or client.beta.threads.create().id
+    if session_key:
+        thread_store.put(session_key, thread_id)
+    return thread_id, stored or []
+
+def is_first_message(session_key=None) -> bool:
+    return not session_key or thread_store.get(session_key) is None
+
+def remember_cached_answer(session_key, user_message: str, answer: str) -> None:
+    # No thread is created for a cached answer; a follow-up question
+    # replays this exchange into the thread it starts.
+    if session_key:
+        thread_store.put(session_key, [{"role": "user", "content": user_message},
+                                       {"role": "assistant", "content": answer}])
+
+def reset_thread(session_key) -> None:
+    thread_store.discard(session_key)
+
+def user_message_for_run(user_message: str, history=()) -> list:
+    # Sent with the run itself, saving a separate messages.create call
+    return [*history, {"role": "user", "content": user_message}]
+
+def wait_for_run(thread_id: str, run_id: str, timeout: float = RUN_TIMEOUT):
+    """Poll a run with exponential backoff until it completes. Failed,
+    cancelled and expired runs raise ChatError, as does the timeout."""
+    deadline = time.monotonic() + timeout
+    delay = POLL_INITIAL_DELAY
+    while True:
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        if run.status == 'completed':
+            return run
+        if run.status in FAILED_RUN_STATUSES:
+            raise ChatError(f"Assistant run {run.status}: {getattr(run, 'last_error', None)}")
+        if time.monotonic() + delay > deadline:
+            client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            raise ChatError(f"Assistant run timed out after {timeout}s")
+        time.sleep(delay)
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+def get_ai_response(user_message: str, session_key=None) -> str:
+    ensure_assistant()
+
+    # Only opening questions are cached; follow-ups depend on the conversation
+    cacheable = is_first_message(session_key)
+    context = grounding_context(user_message)
+    digest = context_digest(context)
+    if cacheable:
+        cached = answer_cache.get(user_message, digest)
+        if cached is not None:
+            remember_cached_answer(session_key, user_message, cached)
+            return cached
+
+    thread_id, history = acquire_thread(session_key)
     run = client.beta.threads.runs.create(
-        thread_id=thread.id,
-        assistant_id=assistant.id
-    )
-    run = client.beta.threads.runs.retrieve(
-        thread_id=thread.id,
-        run_id=run.id
+        thread_id=thread_id,
+        assistant_id=assistant.id,
+        additional_instructions=context,
+        additional_messages=user_message_for_run(user_message, history)
     )
-    while run.status != 'completed':
-        run = client.beta.threads.runs.retrieve(
-            thread_id=thread.id,
-            run_id=run.id
-        )
-    messages = client.beta.threads.messages.list(thread_id=thread.id)
-    return messages.data[0].content[0].text.value
\ No newline at end of file
+    wait_for_run(thread_id, run.id)
+    messages = client.beta.threads.messages.list(thread_id=thread_id, run_id=run.id)
+    answer = messages.data[0].content[0].text.value
+    if cacheable:
+        answer_cache.put(user_message, digest, answer)
+    return answer
+
+def _produce_run_stream(thread_id: str, assistant_id: str, context: str, messages: list,
+                        tokens: queue.Queue, stop: threading.Event):
+    try:
+        with client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            additional_instructions=context,
+            additional_messages=messages,
+            stream=True
+        ) as stream:
+            run_id = None
+            for event in stream:
+                if event.event == 'thread.run.created':
+                    run_id = event.data.id
+                if stop.is_set():
+                    if run_id:
+                        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+                    return
+                if event.event == 'thread.message.delta':
+                    for part in event.data.delta.content or []:
+                        if part.type == 'text' and part.text and part.text.value:
+                            tokens.put(('token', part.text.value))
+                elif event.event in FAILED_RUN_EVENTS:
+                    tokens.put(('error', f"Assistant run ended with {event.event}"))
+                    return
+        tokens.put(('done', None))
+    except Exception as e:
+        tokens.put(('error', str(e)))
+
+def stream_ai_response(user_message: str, session_key=None, timeout: float = RUN_TIMEOUT):
+    """Yield response text fragments as the assistant produces them.
+
+    The OpenAI stream is consumed on a worker thread; this generator only
+    waits on a queue, gives up after `timeout` seconds and tells the worker
+    to stop if the caller goes away."""
+    ensure_assistant()
+
+    cacheable = is_first_message(session_key)
+    context = grounding_context(user_message)
+    digest = context_digest(context)
+    if cacheable:
+        cached = answer_cache.get(user_message, digest)
+        if cached is not None:
+            remember_cached_answer(session_key, user_message, cached)
+            yield cached
+            return
+
+    thread_id, history = acquire_thread(session_key)
+    tokens = queue.Queue()
+    stop = threading.Event()
+    _executor.submit(_produce_run_stream, thread_id, assistant.id, context,
+                     user_message_for_run(user_message, history), tokens, stop)
+    answer = []
+
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ChatError(f"Assistant run timed out after {timeout}s")
+            try:
+                kind, value = tokens.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if kind == 'token':
+                answer.append(value)
+                yield value
+            elif kind == 'done':
+                if cacheable:
+                    answer_cache.put(user_message, digest, ''.join(answer))
+                return
+            else:
+                raise ChatError(value)
+    finally:
+        stop.set()
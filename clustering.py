@@ -0,0 +1,69 @@
+# clustering.py
+from collections import Counter
+import numpy as np
+from app import db
+from models import Item
+from tags import parse_tags
+
+# Grid cell edge, in map coordinates, at zoom 0; each zoom level halves it
+BASE_CELL_SIZE = 256.0
+MAX_ZOOM = 10
+TOP_TAGS = 3
+
+
+def cell_size_for_zoom(zoom: int) -> float:
+    return BASE_CELL_SIZE / (2 ** zoom)
+
+
+def cluster_items(map_id: int, zoom: int) -> dict:
+    rows = (db.session.query(Item.id, Item.x_coord, Item.y_coord, Item.color, Item.tags)
+            .filter(Item.map_id == map_id)
+            .order_by(Item.id)
+            .all())
+    cell_size = cell_size_for_zoom(zoom)
+    result = {"map_id": map_id, "zoom": zoom, "cell_size": cell_size, "clusters": []}
+    if not rows:
+        return result
+
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    coords = np.array([(row[1], row[2]) for row in rows], dtype=np.float64)
+    cells = np.floor(coords / cell_size).astype(np.int64)
+    _, cluster_of, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    cluster_of = cluster_of.ravel()
+    n_clusters = len(counts)
+
+    centroid_x = np.bincount(cluster_of, weights=coords[:, 0], minlength=n_clusters) / counts
+    centroid_y = np.bincount(cluster_of, weights=coords[:, 1], minlength=n_clusters) / counts
+    min_x = np.full(n_clusters, np.inf)
+    min_y = np.full(n_clusters, np.inf)
+    max_x = np.full(n_clusters, -np.inf)
+    max_y = np.full(n_clusters, -np.inf)
+    np.minimum.at(min_x, cluster_of, coords[:, 0])
+    np.minimum.at(min_y, cluster_of, coords[:, 1])
+    np.maximum.at(max_x, cluster_of, coords[:, 0])
+    np.maximum.at(max_y, cluster_of, coords[:, 1])
+
+    colors = [Counter() for _ in range(n_clusters)]
+    tags = [Counter() for _ in range(n_clusters)]
+    for cluster, row in zip(cluster_of.tolist(), rows):
+        colors[cluster][row[3] or 'red'] += 1
+        tags[cluster].update(parse_tags(row[4]))
+
+    # Only read back for single-item clusters, where the index is unique
+    cluster_item = np.empty(n_clusters, dtype=np.int64)
+    cluster_item[cluster_of] = ids
+
+    for cluster in range(n_clusters):
+        entry = {
+            "x": float(centroid_x[cluster]),
+            "y": float(centroid_y[cluster]),
+            "count": int(counts[cluster]),
+            "bbox": [float(min_x[cluster]), float(min_y[cluster]),
+                     float(max_x[cluster]), float(max_y[cluster])],
+            "colors": dict(colors[cluster]),
+            "tags": [[name, count] for name, count in tags[cluster].most_common(TOP_TAGS)],
+        }
+        if counts[cluster] == 1:
+            entry["item_id"] = int(cluster_item[cluster])
+        result["clusters"].append(entry)
+    return result
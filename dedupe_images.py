@@ -0,0 +1,55 @@
+# dedupe_images.py
+import os
+from app import create_app, db
+from models import Item
+from images import generate_variants, delete_variants
+import blobstore
+
+def dedupe_images(collect_unreferenced=False):
+    app = create_app()
+
+    with app.app_context():
+        upload_folder = app.config['UPLOAD_FOLDER']
+        renamed = {}
+        removed = 0
+        for filename in sorted(os.listdir(upload_folder)):
+            path = os.path.join(upload_folder, filename)
+            if not os.path.isfile(path) or filename.endswith('.part') or blobstore.is_blob(filename):
+                continue
+            extension = blobstore.normalize_extension(filename)
+            blob_name, created = blobstore.store_file(path, extension, upload_folder)
+            delete_variants(filename, upload_folder)
+            renamed[f'/static/thumbnails/{filename}'] = f'/static/thumbnails/{blob_name}'
+            if not created:
+                removed += 1
+
+        items = Item.query.filter(Item.image_path.in_(list(renamed))).all() if renamed else []
+        variants_by_blob = {}
+        for item in items:
+            item.image_path = renamed[item.image_path]
+            if item.image_path not in variants_by_blob:
+                blob_path = os.path.join(upload_folder, os.path.basename(item.image_path))
+                try:
+                    variants_by_blob[item.image_path] = generate_variants(
+                        blob_path, upload_folder, '/static/thumbnails')
+                except Exception as e:
+                    print(f"Could not generate thumbnails for {blob_path}: {str(e)}")
+                    variants_by_blob[item.image_path] = None
+            item.image_variants = variants_by_blob[item.image_path]
+        db.session.commit()
+        print(f"Moved {len(renamed)} files into the blob store, "
+              f"dropped {removed} duplicates, updated {len(items)} items.")
+
+        if collect_unreferenced:
+            referenced = {os.path.basename(path) for (path,) in
+                          db.session.query(Item.image_path).filter(Item.image_path.isnot(None))}
+            collected = 0
+            for filename in os.listdir(upload_folder):
+                if blobstore.is_blob(filename) and filename not in referenced:
+                    if blobstore.collect(filename, upload_folder):
+                        collected += 1
+            print(f"Collected {collected} unreferenced blobs.")
+
+if __name__ == "__main__":
+    import sys
+    dedupe_images(collect_unreferenced='--gc' in sys.argv)
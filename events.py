@@ -0,0 +1,167 @@
+# events.py
+import json
+import logging
+import queue
+import select
+import threading
+import time
+import uuid
+from sqlalchemy import text
+from app import db
+from cache import bump_map_version, bump_version, MARKERS
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'ilabmap_events'
+# Identifies events this process published, so the Postgres listener can
+# skip the copies it receives back.
+ORIGIN = uuid.uuid4().hex
+
+
+class Subscription:
+    def __init__(self, map_id: int, max_queued: int):
+        self.map_id = map_id
+        self.queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+
+    def put(self, event: dict) -> None:
+        with self._lock:
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                # A subscriber that can't keep up is told to reload instead of
+                # being allowed to hold an unbounded backlog.
+                while True:
+                    try:
+                        self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                self.queue.put_nowait({"type": "resync", "map_id": self.map_id})
+
+    def get(self, timeout: float):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    """In-process pub/sub of item events, fanned out per map."""
+
+    def __init__(self, max_queued: int = 100):
+        self.max_queued = max_queued
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, map_id: int) -> Subscription:
+        subscription = Subscription(map_id, self.max_queued)
+        with self._lock:
+            self._subscribers.setdefault(map_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.map_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.map_id]
+
+    def dispatch(self, event: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(event["map_id"], ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+class LocalBackend:
+    """Single-process fan-out; also serves as the in-memory stand-in for
+    the Postgres backend."""
+
+    def start(self, app, broker: EventBroker) -> None:
+        self.broker = broker
+
+    def publish(self, event: dict) -> None:
+        self.broker.dispatch(event)
+
+
+class PostgresBackend(LocalBackend):
+    """Fans events out to every worker through LISTEN/NOTIFY."""
+
+    def start(self, app, broker: EventBroker) -> None:
+        super().start(app, broker)
+        self.app = app
+        thread = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+        thread.start()
+
+    def publish(self, event: dict) -> None:
+        super().publish(event)
+        payload = json.dumps(dict(event, origin=ORIGIN))
+        try:
+            with self.app.app_context(), db.engine.connect() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                             {"channel": NOTIFY_CHANNEL, "payload": payload})
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Could not publish event over NOTIFY: {str(e)}")
+
+    def _listen(self) -> None:
+        import psycopg2
+        import psycopg2.extensions
+        with self.app.app_context():
+            dsn = db.engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+        delay = 1
+        while True:
+            try:
+                conn = psycopg2.connect(dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                logger.info(f"Listening for events on {NOTIFY_CHANNEL}")
+                delay = 1
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._receive(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"Event listener failed, reconnecting in {delay}s: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    def _receive(self, payload: str) -> None:
+        event = json.loads(payload)
+        if event.pop("origin", None) == ORIGIN:
+            return
+        # Another worker changed the map, so our cached listings are stale too
+        bump_map_version(event["map_id"])
+        self.broker.dispatch(event)
+
+
+broker = EventBroker()
+backend = LocalBackend()
+
+
+def init_app(app) -> None:
+    global backend
+    broker.max_queued = app.config.get('EVENTS_QUEUE_SIZE', 100)
+    backend = PostgresBackend() if app.config.get('EVENTS_BACKEND') == 'postgres' else LocalBackend()
+    backend.start(app, broker)
+
+
+def item_changed(action: str, item_id: int, revision, *map_ids) -> None:
+    """Invalidate cached listings and notify subscribers after a committed
+    item write. Pass every map the item was on before and after the write."""
+    map_ids = {map_id for map_id in map_ids if map_id is not None}
+    bump_map_version(*map_ids)
+    if action == 'deleted':
+        # The item's 3D markers were deleted with it
+        bump_version(MARKERS)
+    for map_id in map_ids:
+        backend.publish({
+            "type": f"item.{action}",
+            "item_id": item_id,
+            "map_id": map_id,
+            "revision": revision
+        })
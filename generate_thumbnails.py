@@ -0,0 +1,31 @@
+# generate_thumbnails.py
+import os
+from app import create_app, db
+from models import Item
+from images import generate_variants
+
+def generate_thumbnails(force=False):
+    app = create_app()
+
+    with app.app_context():
+        upload_folder = app.config['UPLOAD_FOLDER']
+        items = Item.query.filter(Item.image_path.isnot(None)).all()
+        processed = 0
+        for item in items:
+            if item.image_variants and not force:
+                continue
+            source_path = os.path.join(upload_folder, os.path.basename(item.image_path))
+            if not os.path.exists(source_path):
+                print(f"Skipping item {item.id}: {source_path} not found")
+                continue
+            try:
+                item.image_variants = generate_variants(source_path, upload_folder, '/static/thumbnails')
+                processed += 1
+            except Exception as e:
+                print(f"Skipping item {item.id}: {str(e)}")
+        db.session.commit()
+        print(f"Generated thumbnails for {processed} items.")
+
+if __name__ == "__main__":
+    import sys
+    generate_thumbnails(force='--force' in sys.argv)
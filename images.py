@@ -0,0 +1,87 @@
+# images.py
+import os
+from typing import Optional
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZES = (64, 256, 1024)
+DEFAULT_THUMBNAIL_SIZE = 256
+VARIANT_DIR = 'variants'
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    # JPEG has no alpha channel, so composite transparent images onto white
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _variant_names(stem: str, size: int) -> tuple:
+    return f"{stem}_{size}.webp", f"{stem}_{size}.jpg"
+
+
+def variant_urls(stem: str, url_prefix: str) -> dict:
+    variants = {}
+    for size in THUMBNAIL_SIZES:
+        webp_name, jpeg_name = _variant_names(stem, size)
+        variants[str(size)] = {
+            "webp": f"{url_prefix}/{VARIANT_DIR}/{webp_name}",
+            "jpeg": f"{url_prefix}/{VARIANT_DIR}/{jpeg_name}",
+        }
+    return variants
+
+
+def has_variants(source_path: str, upload_folder: str) -> bool:
+    stem, _ = os.path.splitext(os.path.basename(source_path))
+    output_dir = os.path.join(upload_folder, VARIANT_DIR)
+    return all(os.path.exists(os.path.join(output_dir, name))
+               for size in THUMBNAIL_SIZES for name in _variant_names(stem, size))
+
+
+def delete_variants(source_filename: str, upload_folder: str) -> None:
+    stem, _ = os.path.splitext(os.path.basename(source_filename))
+    output_dir = os.path.join(upload_folder, VARIANT_DIR)
+    for size in THUMBNAIL_SIZES:
+        for name in _variant_names(stem, size):
+            try:
+                os.remove(os.path.join(output_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+def generate_variants(source_path: str, upload_folder: str, url_prefix: str) -> dict:
+    """Write downscaled WebP and JPEG copies of source_path into
+    <upload_folder>/variants and return their URLs keyed by size."""
+    output_dir = os.path.join(upload_folder, VARIANT_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    stem, _ = os.path.splitext(os.path.basename(source_path))
+
+    with Image.open(source_path) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+        for size in THUMBNAIL_SIZES:
+            resized = original.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+
+            webp_name, jpeg_name = _variant_names(stem, size)
+            resized.save(os.path.join(output_dir, webp_name), 'WEBP',
+                         quality=WEBP_QUALITY, method=6)
+            _flatten(resized).save(os.path.join(output_dir, jpeg_name), 'JPEG',
+                                   quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return variant_urls(stem, url_prefix)
+
+
+def pick_variant(variants: Optional[dict], size: int, image_format: str = 'webp') -> Optional[str]:
+    """Return the smallest variant at least `size` pixels wide, falling back
+    to the largest one available."""
+    if not variants:
+        return None
+    sizes = sorted(int(s) for s in variants)
+    chosen = next((s for s in sizes if s >= size), sizes[-1])
+    variant = variants[str(chosen)]
+    return variant.get(image_format) or variant.get('jpeg')
@@ -0,0 +1,28 @@
+# ingest_maps.py
+from app import create_app, db
+from models import Map
+from tiles import ingest_map, TILE_SIZE
+
+def ingest_maps(map_ids=None, tile_size=TILE_SIZE):
+    app = create_app()
+
+    with app.app_context():
+        query = Map.query.order_by(Map.id)
+        if map_ids:
+            query = query.filter(Map.id.in_(map_ids))
+        processed = 0
+        for map in query:
+            try:
+                result = ingest_map(map, app.static_folder, tile_size)
+            except (OSError, ValueError) as e:
+                print(f"Skipping map {map.id} ({map.name}): {str(e)}")
+                continue
+            processed += 1
+            print(f"Map {map.id} ({map.name}): {result['width']}x{result['height']}, "
+                  f"zoom 0-{result['max_zoom']}, SVG {result['svg_bytes_saved']} bytes smaller")
+        db.session.commit()
+        print(f"Ingested {processed} maps.")
+
+if __name__ == "__main__":
+    import sys
+    ingest_maps([int(arg) for arg in sys.argv[1:] if arg.isdigit()])
@@ -0,0 +1,111 @@
+# manifest.py
+import os
+import threading
+from typing import Optional
+from images import VARIANT_DIR
+import blobstore
+
+URL_PREFIX = '/static/thumbnails'
+
+
+class ImageIndex:
+    """Listing of the upload folder and its variants directory, so image
+    existence, size and hash can be answered without touching the disk per
+    item. Rebuilt after invalidate() or when either directory's mtime
+    changes (which also catches the maintenance scripts)."""
+
+    def __init__(self):
+        self.generation = 0
+        self._signature = None
+        self._files = {}    # relative path -> (size, mtime_ns)
+        self._digests = {}  # relative path -> (size, mtime_ns, sha256)
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+
+    def _directory_signature(self, folder: str) -> tuple:
+        mtimes = []
+        for path in (folder, os.path.join(folder, VARIANT_DIR)):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                mtimes.append(None)
+        return (self.generation, *mtimes)
+
+    def _scan(self, folder: str) -> dict:
+        files = {}
+        for prefix in ('', VARIANT_DIR):
+            try:
+                entries = os.scandir(os.path.join(folder, prefix))
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    # Skip in-flight uploads
+                    if entry.is_file() and not entry.name.endswith('.part'):
+                        stat = entry.stat()
+                        files[f"{prefix}/{entry.name}" if prefix else entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def refresh(self, folder: str) -> tuple:
+        """Return the current signature, rescanning if it changed."""
+        with self._lock:
+            signature = self._directory_signature(folder)
+            if signature != self._signature:
+                self._files = self._scan(folder)
+                self._digests = {path: digest for path, digest in self._digests.items()
+                                 if self._files.get(path) == digest[:2]}
+                self._signature = signature
+            return signature
+
+    def _digest(self, folder: str, relative_path: str, size: int, mtime_ns: int) -> str:
+        name = os.path.basename(relative_path)
+        if '/' not in relative_path and blobstore.is_blob(name):
+            # Blob names already are their content hash
+            return os.path.splitext(name)[0]
+        cached = self._digests.get(relative_path)
+        if cached and cached[:2] == (size, mtime_ns):
+            return cached[2]
+        digest = blobstore.file_digest(os.path.join(folder, relative_path))
+        self._digests[relative_path] = (size, mtime_ns, digest)
+        return digest
+
+    def describe(self, folder: str, url: Optional[str]) -> Optional[dict]:
+        """{"size", "sha256"} for an image URL under the upload folder, or
+        None when it doesn't resolve to a file."""
+        relative_path = relative_image_path(url)
+        if relative_path is None:
+            return None
+        self.refresh(folder)
+        with self._lock:
+            stat = self._files.get(relative_path)
+            if stat is None:
+                return None
+            try:
+                return {"size": stat[0], "sha256": self._digest(folder, relative_path, *stat)}
+            except FileNotFoundError:
+                return None
+
+    def exists(self, folder: str, url: Optional[str]) -> bool:
+        relative_path = relative_image_path(url)
+        if relative_path is None:
+            return False
+        self.refresh(folder)
+        return relative_path in self._files
+
+
+def relative_image_path(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    path = '/' + url.lstrip('/')
+    if not path.startswith(URL_PREFIX + '/'):
+        return None
+    relative_path = path[len(URL_PREFIX) + 1:]
+    if '..' in relative_path.split('/'):
+        return None
+    return relative_path
+
+
+image_index = ImageIndex()
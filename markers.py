@@ -0,0 +1,158 @@
+# markers.py
+import heapq
+import math
+import threading
+import numpy as np
+from sqlalchemy import insert
+from app import db
+from models import Item, Marker3D
+from cache import get_version, MARKERS
+
+MAX_MARKERS = 1000
+MARKER_FIELDS = ('id', 'x', 'y', 'z', 'item_id', 'map_id')
+
+
+class KDTree:
+    """3-d tree over marker positions for nearest-marker lookups. Built in
+    one go from the current markers and replaced when they change."""
+
+    def __init__(self, ids, points):
+        self.ids = list(ids)
+        self.points = np.asarray(points, dtype=float).reshape(-1, 3)
+        # Per node: (point index, split axis, left child, right child)
+        self.nodes = []
+        self.root = self._build(np.arange(len(self.ids)), 0)
+
+    def _build(self, indices: np.ndarray, depth: int) -> int:
+        if not len(indices):
+            return -1
+        # Split on the widest axis at the median
+        spread = np.ptp(self.points[indices], axis=0)
+        axis = int(spread.argmax()) if len(indices) > 1 else depth % 3
+        middle = len(indices) // 2
+        order = indices[np.argpartition(self.points[indices, axis], middle)]
+        node = len(self.nodes)
+        self.nodes.append(None)
+        left = self._build(order[:middle], depth + 1)
+        right = self._build(order[middle + 1:], depth + 1)
+        self.nodes[node] = (int(order[middle]), axis, left, right)
+        return node
+
+    def nearest(self, point, k: int, max_distance: float = math.inf) -> list:
+        """Return up to k (distance, marker_id) pairs within max_distance,
+        closest first."""
+        if self.root < 0 or k <= 0:
+            return []
+        target = np.asarray(point, dtype=float)
+        heap = []  # max-heap of the k best as (-distance, marker index)
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node < 0:
+                continue
+            index, axis, left, right = self.nodes[node]
+            distance = float(np.linalg.norm(self.points[index] - target))
+            if distance <= max_distance:
+                if len(heap) < k:
+                    heapq.heappush(heap, (-distance, index))
+                elif distance < -heap[0][0]:
+                    heapq.heapreplace(heap, (-distance, index))
+            offset = target[axis] - self.points[index, axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            # The far side can only help if the splitting plane is in reach
+            bound = -heap[0][0] if len(heap) == k else max_distance
+            if abs(offset) <= bound:
+                stack.append(far)
+            stack.append(near)
+        return sorted((-distance, self.ids[index]) for distance, index in heap)
+
+
+_trees = {}
+_trees_lock = threading.Lock()
+
+
+def get_tree(map_id=None) -> KDTree:
+    """The tree for one map's markers, or for every marker when map_id is
+    None, rebuilt after markers are saved or deleted."""
+    version = get_version(MARKERS)
+    with _trees_lock:
+        cached = _trees.get(map_id)
+    if cached and cached[0] == version:
+        return cached[1]
+    query = db.session.query(Marker3D.id, Marker3D.x, Marker3D.y, Marker3D.z)
+    if map_id is not None:
+        query = query.filter(Marker3D.map_id == map_id)
+    rows = query.all()
+    tree = KDTree([row[0] for row in rows], [row[1:] for row in rows])
+    with _trees_lock:
+        _trees[map_id] = (version, tree)
+    return tree
+
+
+def marker_to_dict(marker) -> dict:
+    return {field: getattr(marker, field) for field in MARKER_FIELDS}
+
+
+def validate_marker(row, item_maps: dict, map_ids: set) -> tuple:
+    """Return (values, errors) for one marker to save. item_maps maps each
+    referenced item id to its map; a linked marker defaults to that map."""
+    if not isinstance(row, dict):
+        return None, ["expected an object"]
+    errors = []
+    values = {}
+    for field in ('x', 'y', 'z'):
+        try:
+            values[field] = float(row[field])
+            if not math.isfinite(values[field]):
+                raise ValueError
+        except KeyError:
+            errors.append(f"{field} is required")
+        except (TypeError, ValueError):
+            errors.append(f"{field} must be a number")
+    for field in ('item_id', 'map_id'):
+        try:
+            values[field] = None if row.get(field) is None else int(row[field])
+        except (TypeError, ValueError):
+            errors.append(f"{field} must be an integer")
+    if errors:
+        return values, errors
+    if values['item_id'] is not None:
+        if values['item_id'] not in item_maps:
+            errors.append(f"item {values['item_id']} does not exist")
+        elif values['map_id'] is None:
+            values['map_id'] = item_maps[values['item_id']]
+    if values['map_id'] is not None and values['map_id'] not in map_ids:
+        errors.append(f"map {values['map_id']} does not exist")
+    return values, errors
+
+
+def referenced_item_maps(rows) -> dict:
+    item_ids = set()
+    for row in rows:
+        try:
+            item_ids.add(int(row['item_id']))
+        except (KeyError, TypeError, ValueError):
+            continue
+    if not item_ids:
+        return {}
+    return dict(db.session.query(Item.id, Item.map_id).filter(Item.id.in_(list(item_ids))))
+
+
+def insert_markers(rows: list) -> list:
+    """Insert validated markers with one executemany and return their ids
+    in row order; the caller commits."""
+    return db.session.scalars(insert(Marker3D).returning(Marker3D.id, sort_by_parameter_order=True),
+                              rows).all()
+
+
+def nearest_markers(x: float, y: float, z: float, k: int, max_distance: float = math.inf,
+                    map_id=None) -> list:
+    """Return (marker, distance) pairs for the k markers closest to the
+    point, each with its linked item loaded."""
+    matches = get_tree(map_id).nearest((x, y, z), k, max_distance)
+    if not matches:
+        return []
+    markers = {marker.id: marker for marker in
+               Marker3D.query.options(db.joinedload(Marker3D.item))
+               .filter(Marker3D.id.in_([marker_id for _, marker_id in matches]))}
+    return [(markers[marker_id], distance) for distance, marker_id in matches if marker_id in markers]
@@ -0,0 +1,387 @@
+# meshes.py
+import base64
+import copy
+import io
+import json
+import os
+import struct
+import numpy as np
+from PIL import Image
+
+MODEL_DIR = 'models'
+LODS = ('coarse', 'full')
+COARSE_CELLS = 48
+MAX_TEXTURE_SIZE = 1024
+JPEG_QUALITY = 85
+
+GLB_MAGIC = b'glTF'
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+TRIANGLES = 4
+
+COMPONENT_TYPES = {5120: np.int8, 5121: np.uint8, 5122: np.int16, 5123: np.uint16,
+                   5125: np.uint32, 5126: np.float32}
+COMPONENT_CODES = {np.dtype(dtype): code for code, dtype in COMPONENT_TYPES.items()}
+TYPE_SIZES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT4': 16}
+TYPE_NAMES = {size: name for name, size in TYPE_SIZES.items() if name != 'MAT4'}
+
+
+def load_model(path: str) -> tuple:
+    """Read a .glb or .gltf file into (gltf json, binary blob). Every buffer
+    ends up in the one blob, with buffer views rebased onto it."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    buffers = []
+    if data[:4] == GLB_MAGIC:
+        json_length, chunk_type = struct.unpack_from('<II', data, 12)
+        if chunk_type != CHUNK_JSON:
+            raise ValueError(f"{path}: first GLB chunk is not JSON")
+        gltf = json.loads(data[20:20 + json_length])
+        offset = 20 + json_length
+        if offset < len(data):
+            bin_length, _ = struct.unpack_from('<II', data, offset)
+            buffers.append(data[offset + 8:offset + 8 + bin_length])
+    else:
+        gltf = json.loads(data)
+    for index, buffer in enumerate(gltf.get('buffers', [])):
+        uri = buffer.get('uri')
+        if uri is None:
+            if index != 0 or not buffers:
+                raise ValueError(f"{path}: buffer {index} has no data")
+            continue
+        if uri.startswith('data:'):
+            buffers.append(base64.b64decode(uri.split(',', 1)[1]))
+        else:
+            with open(os.path.join(os.path.dirname(path), uri), 'rb') as f:
+                buffers.append(f.read())
+
+    blob = bytearray()
+    starts = []
+    for buffer in buffers:
+        blob.extend(b'\0' * (-len(blob) % 4))
+        starts.append(len(blob))
+        blob.extend(buffer)
+    for view in gltf.get('bufferViews', []):
+        view['byteOffset'] = view.get('byteOffset', 0) + starts[view['buffer']]
+        view['buffer'] = 0
+    return gltf, bytes(blob)
+
+
+def read_accessor(gltf: dict, blob: bytes, index: int) -> np.ndarray:
+    """Return an accessor as a (count, components) array, or (count,) for
+    scalars. Normalized integers are converted back to floats."""
+    accessor = gltf['accessors'][index]
+    if 'sparse' in accessor:
+        raise ValueError("sparse accessors are not supported")
+    dtype = np.dtype(COMPONENT_TYPES[accessor['componentType']]).newbyteorder('<')
+    components = TYPE_SIZES[accessor['type']]
+    count = accessor['count']
+    view = gltf['bufferViews'][accessor['bufferView']]
+    start = view.get('byteOffset', 0) + accessor.get('byteOffset', 0)
+    element_size = dtype.itemsize * components
+    stride = view.get('byteStride') or element_size
+    raw = np.frombuffer(blob, dtype=np.uint8, count=stride * (count - 1) + element_size if count else 0,
+                        offset=start)
+    if stride == element_size:
+        values = raw.view(dtype).reshape(count, components)
+    else:
+        values = np.lib.stride_tricks.as_strided(raw, (count, element_size), (stride, 1)).copy()
+        values = values.view(dtype).reshape(count, components)
+    if accessor.get('normalized'):
+        info = np.iinfo(dtype)
+        values = np.maximum(values / info.max, -1.0) if info.min < 0 else values / info.max
+    return values.reshape(count) if components == 1 else values
+
+
+class BinaryWriter:
+    """Accumulates buffer views and accessors for a new single-buffer GLB."""
+
+    def __init__(self):
+        self.blob = bytearray()
+        self.views = []
+        self.accessors = []
+
+    def add_view(self, data: bytes, target=None, stride=None) -> int:
+        self.blob.extend(b'\0' * (-len(self.blob) % 4))
+        view = {"buffer": 0, "byteOffset": len(self.blob), "byteLength": len(data)}
+        if target:
+            view['target'] = target
+        if stride:
+            view['byteStride'] = stride
+        self.blob.extend(data)
+        self.views.append(view)
+        return len(self.views) - 1
+
+    def add_accessor(self, values: np.ndarray, target=None, normalized=False, bounds=False) -> int:
+        components = 1 if values.ndim == 1 else values.shape[1]
+        element_size = values.dtype.itemsize * components
+        # Vertex attributes must start on 4-byte boundaries
+        stride = -(-element_size // 4) * 4 if target == ARRAY_BUFFER else None
+        if stride and stride != element_size:
+            padded = np.zeros((len(values), stride), dtype=np.uint8)
+            padded[:, :element_size] = values.reshape(len(values), -1).view(np.uint8)
+            data = padded.tobytes()
+        else:
+            data = values.tobytes()
+            stride = None
+        accessor = {"bufferView": self.add_view(data, target, stride),
+                    "componentType": COMPONENT_CODES[values.dtype],
+                    "count": len(values), "type": TYPE_NAMES[components]}
+        if normalized:
+            accessor['normalized'] = True
+        if bounds:
+            flat = values.reshape(len(values), -1)
+            accessor['min'] = flat.min(axis=0).tolist()
+            accessor['max'] = flat.max(axis=0).tolist()
+        self.accessors.append(accessor)
+        return len(self.accessors) - 1
+
+
+def _material_textures(material: dict) -> list:
+    pbr = material.get('pbrMetallicRoughness', {})
+    slots = [pbr.get('baseColorTexture'), pbr.get('metallicRoughnessTexture'),
+             material.get('normalTexture'), material.get('occlusionTexture'), material.get('emissiveTexture')]
+    return [slot['index'] for slot in slots if slot]
+
+
+def _strip_textures(material: dict) -> None:
+    pbr = material.get('pbrMetallicRoughness', {})
+    for key in ('baseColorTexture', 'metallicRoughnessTexture'):
+        pbr.pop(key, None)
+    for key in ('normalTexture', 'occlusionTexture', 'emissiveTexture'):
+        material.pop(key, None)
+
+
+def _opaque_images(gltf: dict) -> set:
+    """Images only used by opaque materials, which can drop their alpha."""
+    textures = gltf.get('textures', [])
+    opaque, blended = set(), set()
+    for material in gltf.get('materials', []):
+        target = opaque if material.get('alphaMode', 'OPAQUE') == 'OPAQUE' else blended
+        target.update(textures[index].get('source') for index in _material_textures(material))
+    return opaque - blended
+
+
+def _image_bytes(gltf: dict, blob: bytes, image: dict) -> bytes:
+    if 'bufferView' in image:
+        view = gltf['bufferViews'][image['bufferView']]
+        start = view.get('byteOffset', 0)
+        return blob[start:start + view['byteLength']]
+    uri = image.get('uri', '')
+    if not uri.startswith('data:'):
+        raise ValueError("external image files are not supported")
+    return base64.b64decode(uri.split(',', 1)[1])
+
+
+def _merge_primitives(gltf: dict, blob: bytes, mesh: dict, keep_texcoords: bool) -> list:
+    """Combine a mesh's triangle primitives that share a material into one
+    draw call each. Returns [(material, attributes, indices)]."""
+    groups = {}
+    for primitive in mesh['primitives']:
+        if primitive.get('mode', TRIANGLES) != TRIANGLES or primitive.get('targets'):
+            raise ValueError("only triangle lists without morph targets are supported")
+        names = tuple(sorted(name for name in primitive['attributes']
+                             if name in ('POSITION', 'NORMAL') or (keep_texcoords and name == 'TEXCOORD_0')))
+        attributes = {name: read_accessor(gltf, blob, primitive['attributes'][name]) for name in names}
+        count = len(attributes['POSITION'])
+        if 'indices' in primitive:
+            indices = read_accessor(gltf, blob, primitive['indices']).astype(np.uint32)
+        else:
+            indices = np.arange(count, dtype=np.uint32)
+        group = groups.setdefault((primitive.get('material'), names), ([], [], [0]))
+        group[0].append(attributes)
+        group[1].append(indices + group[2][0])
+        group[2][0] += count
+    return [(material, {name: np.concatenate([part[name] for part in parts]) for name in names},
+             np.concatenate(index_parts))
+            for (material, names), (parts, index_parts, _) in groups.items()]
+
+
+def simplify(attributes: dict, indices: np.ndarray, cells: int) -> tuple:
+    """Vertex clustering: snap vertices to a cells^3 grid over the bounding
+    box, average each cell and drop triangles that collapse."""
+    positions = attributes['POSITION']
+    low = positions.min(axis=0)
+    extent = np.maximum(positions.max(axis=0) - low, 1e-9)
+    grid = np.minimum((positions - low) / extent * cells, cells - 1).astype(np.int64)
+    keys = (grid[:, 0] * cells + grid[:, 1]) * cells + grid[:, 2]
+    _, cluster = np.unique(keys, return_inverse=True)
+    clusters = cluster.max() + 1 if len(cluster) else 0
+    counts = np.bincount(cluster, minlength=clusters)[:, None]
+    merged = {}
+    for name, values in attributes.items():
+        total = np.zeros((clusters, values.shape[1]))
+        np.add.at(total, cluster, values)
+        merged[name] = total / counts
+    if 'NORMAL' in merged:
+        lengths = np.linalg.norm(merged['NORMAL'], axis=1, keepdims=True)
+        merged['NORMAL'] = np.divide(merged['NORMAL'], lengths, out=np.zeros_like(merged['NORMAL']),
+                                     where=lengths > 0)
+    triangles = cluster[indices].reshape(-1, 3)
+    keep = ((triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2])
+            & (triangles[:, 0] != triangles[:, 2]))
+    triangles = np.unique(triangles[keep], axis=0) if keep.any() else triangles[:0]
+    return merged, triangles.reshape(-1).astype(np.uint32)
+
+
+def _write_primitive(writer: BinaryWriter, attributes: dict, indices: np.ndarray,
+                     center: np.ndarray, scale: float, quantize: bool) -> dict:
+    written = {}
+    positions = attributes['POSITION']
+    if quantize:
+        # KHR_mesh_quantization: normalized int16 undone by the node transform
+        quantized = np.round((positions - center) / scale * 32767).clip(-32767, 32767).astype(np.int16)
+        written['POSITION'] = writer.add_accessor(quantized, ARRAY_BUFFER, normalized=True, bounds=True)
+    else:
+        written['POSITION'] = writer.add_accessor(positions.astype(np.float32), ARRAY_BUFFER, bounds=True)
+    if 'NORMAL' in attributes:
+        normals = attributes['NORMAL']
+        if quantize:
+            written['NORMAL'] = writer.add_accessor(
+                np.round(normals * 127).clip(-127, 127).astype(np.int8), ARRAY_BUFFER, normalized=True)
+        else:
+            written['NORMAL'] = writer.add_accessor(normals.astype(np.float32), ARRAY_BUFFER)
+    if 'TEXCOORD_0' in attributes:
+        uvs = attributes['TEXCOORD_0']
+        if quantize and uvs.min() >= 0 and uvs.max() <= 1:
+            written['TEXCOORD_0'] = writer.add_accessor(
+                np.round(uvs * 65535).astype(np.uint16), ARRAY_BUFFER, normalized=True)
+        else:
+            written['TEXCOORD_0'] = writer.add_accessor(uvs.astype(np.float32), ARRAY_BUFFER)
+    # 0xFFFF is the primitive restart value, so stay below it for uint16
+    index_type = np.uint16 if len(positions) < 0xFFFF else np.uint32
+    return {"attributes": written,
+            "indices": writer.add_accessor(indices.astype(index_type), ELEMENT_ARRAY_BUFFER)}
+
+
+def _encode_image(data: bytes, opaque: bool, max_size: int) -> tuple:
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if max_size:
+            image.thumbnail((max_size, max_size), Image.LANCZOS)
+        output = io.BytesIO()
+        if opaque:
+            image.convert('RGB').save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            return output.getvalue(), 'image/jpeg'
+        image.save(output, 'PNG', optimize=True)
+        return output.getvalue(), 'image/png'
+
+
+def optimize(gltf: dict, blob: bytes, quantize: bool = True, cells=None,
+             max_texture: int = MAX_TEXTURE_SIZE) -> tuple:
+    """Return a rewritten (gltf, blob): primitives merged per material,
+    attributes quantized, unused texture coordinates dropped and textures
+    re-encoded. With cells, meshes are also simplified to that grid and
+    textures are left out entirely, for a quick first render."""
+    if gltf.get('skins') or gltf.get('animations'):
+        raise ValueError("skinned or animated models are not supported")
+    gltf = copy.deepcopy(gltf)
+    writer = BinaryWriter()
+    keep_textures = cells is None
+    textured = {index for index, material in enumerate(gltf.get('materials', []))
+                if _material_textures(material)} if keep_textures else set()
+
+    mesh_transforms = {}
+    for mesh_index, mesh in enumerate(gltf.get('meshes', [])):
+        primitives = []
+        for material, attributes, indices in _merge_primitives(gltf, blob, mesh, bool(textured)):
+            if material not in textured:
+                attributes.pop('TEXCOORD_0', None)
+            if cells:
+                attributes, indices = simplify(attributes, indices, cells)
+            if len(indices):
+                primitives.append((material, attributes, indices))
+        positions = np.concatenate([attributes['POSITION'] for _, attributes, _ in primitives]) \
+            if primitives else np.zeros((1, 3))
+        low, high = positions.min(axis=0), positions.max(axis=0)
+        center = (low + high) / 2
+        scale = float(max((high - low).max() / 2, 1e-9))
+        mesh_transforms[mesh_index] = (center, scale)
+        mesh['primitives'] = []
+        for material, attributes, indices in primitives:
+            primitive = _write_primitive(writer, attributes, indices, center, scale, quantize)
+            if material is not None:
+                primitive['material'] = material
+            mesh['primitives'].append(primitive)
+
+    if quantize:
+        # Each mesh moves to a child node holding its dequantization transform
+        nodes = gltf.get('nodes', [])
+        for node in list(nodes):
+            if 'mesh' in node:
+                mesh_index = node.pop('mesh')
+                center, scale = mesh_transforms[mesh_index]
+                nodes.append({"mesh": mesh_index, "translation": center.tolist(), "scale": [scale] * 3})
+                node.setdefault('children', []).append(len(nodes) - 1)
+
+    images = gltf.get('images', [])
+    if keep_textures and textured:
+        opaque_images = _opaque_images(gltf)
+        for index, image in enumerate(images):
+            data = _image_bytes(gltf, blob, image)
+            data, mime_type = _encode_image(data, index in opaque_images, max_texture)
+            image.pop('uri', None)
+            image['bufferView'] = writer.add_view(data)
+            image['mimeType'] = mime_type
+    else:
+        for material in gltf.get('materials', []):
+            _strip_textures(material)
+        for key in ('images', 'textures', 'samplers'):
+            gltf.pop(key, None)
+
+    gltf['accessors'] = writer.accessors
+    gltf['bufferViews'] = writer.views
+    gltf['buffers'] = [{"byteLength": len(writer.blob)}]
+    if quantize:
+        for key in ('extensionsUsed', 'extensionsRequired'):
+            gltf[key] = sorted(set(gltf.get(key, [])) | {'KHR_mesh_quantization'})
+    return gltf, bytes(writer.blob)
+
+
+def save_glb(path: str, gltf: dict, blob: bytes) -> int:
+    """Write a binary glTF atomically and return its size."""
+    document = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    document += b' ' * (-len(document) % 4)
+    blob += b'\0' * (-len(blob) % 4)
+    chunks = struct.pack('<II', len(document), CHUNK_JSON) + document
+    if blob:
+        chunks += struct.pack('<II', len(blob), CHUNK_BIN) + blob
+    data = GLB_MAGIC + struct.pack('<II', 2, 12 + len(chunks)) + chunks
+    with open(path + '.part', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.part', path)
+    return len(data)
+
+
+def model_path(static_folder: str, name: str, lod: str) -> str:
+    return os.path.join(static_folder, MODEL_DIR, f"{name}.{lod}.glb")
+
+
+def process_model(source: str, static_folder: str, name=None, max_texture: int = MAX_TEXTURE_SIZE,
+                  cells: int = COARSE_CELLS) -> dict:
+    """Write the full (quantized) and coarse LODs of a model to
+    static/models and return their sizes keyed by LOD."""
+    name = name or os.path.splitext(os.path.basename(source))[0]
+    gltf, blob = load_model(source)
+    os.makedirs(os.path.join(static_folder, MODEL_DIR), exist_ok=True)
+    sizes = {}
+    for lod in LODS:
+        optimized = optimize(gltf, blob, cells=cells if lod == 'coarse' else None, max_texture=max_texture)
+        sizes[lod] = save_glb(model_path(static_folder, name, lod), *optimized)
+    return sizes
+
+
+def model_urls(static_folder: str, name: str) -> list:
+    """URLs of a model's processed LODs, coarsest first, each versioned by
+    its size and mtime so it can be cached for good. Empty when the model
+    hasn't been processed."""
+    urls = []
+    for lod in LODS:
+        try:
+            stat = os.stat(model_path(static_folder, name, lod))
+        except FileNotFoundError:
+            continue
+        urls.append(f"/models/{name}/{lod}.glb?v={stat.st_mtime_ns:x}-{stat.st_size:x}")
+    return urls
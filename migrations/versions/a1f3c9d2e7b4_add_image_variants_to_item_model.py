@@ -0,0 +1,26 @@
+"""Add image_variants to Item model
+
+Revision ID: a1f3c9d2e7b4
+Revises: e94892c1aa38
+Create Date: 2024-10-21 10:02:37.114862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1f3c9d2e7b4'
+down_revision = 'e94892c1aa38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.drop_column('image_variants')
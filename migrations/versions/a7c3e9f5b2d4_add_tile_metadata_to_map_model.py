@@ -0,0 +1,34 @@
+"""Add tile pyramid metadata to Map model
+
+Revision ID: a7c3e9f5b2d4
+Revises: f2b6d8a4c1e9
+Create Date: 2024-10-31 15:48:20.407913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f5b2d4'
+down_revision = 'f2b6d8a4c1e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('map', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tile_size', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('tile_max_zoom', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('tile_width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('tile_height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('tile_version', sa.String(length=16), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('map', schema=None) as batch_op:
+        batch_op.drop_column('tile_version')
+        batch_op.drop_column('tile_height')
+        batch_op.drop_column('tile_width')
+        batch_op.drop_column('tile_max_zoom')
+        batch_op.drop_column('tile_size')
@@ -0,0 +1,53 @@
+"""Add item revisions, updated_at and tombstones for incremental sync
+
+Revision ID: b7d2e4f1a9c3
+Revises: a1f3c9d2e7b4
+Create Date: 2024-10-22 16:40:11.502318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e4f1a9c3'
+down_revision = 'a1f3c9d2e7b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                      server_default=sa.func.now()))
+        batch_op.add_column(sa.Column('revision', sa.BigInteger(), nullable=False,
+                                      server_default='0'))
+        batch_op.create_index('ix_item_map_id_revision', ['map_id', 'revision'], unique=False)
+
+    op.create_table('item_tombstone',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('map_id', sa.Integer(), nullable=False),
+        sa.Column('revision', sa.BigInteger(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_item_tombstone_map_id_revision', 'item_tombstone',
+                    ['map_id', 'revision'], unique=False)
+
+    op.create_table('sync_state',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('revision', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO sync_state (id, revision) VALUES (1, 0)")
+
+
+def downgrade():
+    op.drop_table('sync_state')
+    op.drop_index('ix_item_tombstone_map_id_revision', table_name='item_tombstone')
+    op.drop_table('item_tombstone')
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.drop_index('ix_item_map_id_revision')
+        batch_op.drop_column('revision')
+        batch_op.drop_column('updated_at')
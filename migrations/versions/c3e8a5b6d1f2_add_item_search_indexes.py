@@ -0,0 +1,41 @@
+"""Add full-text and trigram search indexes on Item
+
+Revision ID: c3e8a5b6d1f2
+Revises: b7d2e4f1a9c3
+Create Date: 2024-10-24 09:12:48.730215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8a5b6d1f2'
+down_revision = 'b7d2e4f1a9c3'
+branch_labels = None
+depends_on = None
+
+# Must match search.SEARCH_VECTOR, otherwise the planner won't use the index
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(tags, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+
+
+def upgrade():
+    # SQLite dev databases use the in-memory index in search.py instead
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(f"CREATE INDEX ix_item_search_vector ON item USING gin (({SEARCH_VECTOR}))")
+    op.execute("CREATE INDEX ix_item_name_trgm ON item USING gin (name gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_item_tags_trgm ON item USING gin ((coalesce(tags, '')) gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_item_tags_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_item_name_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_item_search_vector")
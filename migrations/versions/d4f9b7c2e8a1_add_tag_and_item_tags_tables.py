@@ -0,0 +1,62 @@
+"""Add Tag and item_tags tables and populate them from Item.tags
+
+Revision ID: d4f9b7c2e8a1
+Revises: c3e8a5b6d1f2
+Create Date: 2024-10-25 14:27:05.318842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f9b7c2e8a1'
+down_revision = 'c3e8a5b6d1f2'
+branch_labels = None
+depends_on = None
+
+
+def parse_tags(tags):
+    # Frozen copy of tags.parse_tags so later changes can't alter this migration
+    names = []
+    for raw in (tags or '').split(','):
+        name = ' '.join(raw.split()).lower()[:100]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def upgrade():
+    tag_table = op.create_table('tag',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    item_tags_table = op.create_table('item_tags',
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('tag_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['item_id'], ['item.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tag_id'], ['tag.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('item_id', 'tag_id')
+    )
+    op.create_index('ix_item_tags_tag_id_item_id', 'item_tags', ['tag_id', 'item_id'], unique=False)
+
+    bind = op.get_bind()
+    item_tag_names = {item_id: parse_tags(tags)
+                      for item_id, tags in bind.execute(sa.text("SELECT id, tags FROM item"))}
+    names = sorted({name for tag_names in item_tag_names.values() for name in tag_names})
+    if not names:
+        return
+    op.bulk_insert(tag_table, [{"name": name} for name in names])
+    tag_ids = dict(bind.execute(sa.text("SELECT name, id FROM tag")).fetchall())
+    op.bulk_insert(item_tags_table, [
+        {"item_id": item_id, "tag_id": tag_ids[name]}
+        for item_id, tag_names in item_tag_names.items() for name in tag_names
+    ])
+
+
+def downgrade():
+    op.drop_index('ix_item_tags_tag_id_item_id', table_name='item_tags')
+    op.drop_table('item_tags')
+    op.drop_table('tag')
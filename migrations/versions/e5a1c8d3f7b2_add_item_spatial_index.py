@@ -0,0 +1,26 @@
+"""Add composite (map_id, x_coord, y_coord) index on Item
+
+Revision ID: e5a1c8d3f7b2
+Revises: d4f9b7c2e8a1
+Create Date: 2024-10-28 11:05:52.941637
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1c8d3f7b2'
+down_revision = 'd4f9b7c2e8a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.create_index('ix_item_map_id_x_coord_y_coord', ['map_id', 'x_coord', 'y_coord'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.drop_index('ix_item_map_id_x_coord_y_coord')
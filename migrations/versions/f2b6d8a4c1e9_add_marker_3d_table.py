@@ -0,0 +1,39 @@
+"""Add Marker3D table for markers placed in the 3D view
+
+Revision ID: f2b6d8a4c1e9
+Revises: e5a1c8d3f7b2
+Create Date: 2024-10-30 10:12:37.216845
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b6d8a4c1e9'
+down_revision = 'e5a1c8d3f7b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('marker_3d',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('x', sa.Float(), nullable=False),
+        sa.Column('y', sa.Float(), nullable=False),
+        sa.Column('z', sa.Float(), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=True),
+        sa.Column('map_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        sa.ForeignKeyConstraint(['item_id'], ['item.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['map_id'], ['map.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_marker_3d_item_id', 'marker_3d', ['item_id'], unique=False)
+    op.create_index('ix_marker_3d_map_id', 'marker_3d', ['map_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_marker_3d_map_id', table_name='marker_3d')
+    op.drop_index('ix_marker_3d_item_id', table_name='marker_3d')
+    op.drop_table('marker_3d')
@@ -1,13 +1,34 @@
 # models.py
+import datetime
 from app import db
 
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
 class Map(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     svg_path = db.Column(db.String(200), nullable=False)
     background_color = db.Column(db.String(20), default='white')
+    # Raster tile pyramid written by ingest_maps.py, see tiles.py
+    tile_size = db.Column(db.Integer, nullable=True)
+    tile_max_zoom = db.Column(db.Integer, nullable=True)
+    tile_width = db.Column(db.Integer, nullable=True)
+    tile_height = db.Column(db.Integer, nullable=True)
+    tile_version = db.Column(db.String(16), nullable=True)
     items = db.relationship('Item', backref='map', lazy=True)
 
+item_tags = db.Table(
+    'item_tags',
+    db.Column('item_id', db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_item_tags_tag_id_item_id', 'tag_id', 'item_id'),
+)
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
 class Item(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -16,9 +37,50 @@ class Item(db.Model):
     y_coord = db.Column(db.Float, nullable=False)
     map_id = db.Column(db.Integer, db.ForeignKey('map.id'), nullable=False)
     image_path = db.Column(db.String(200), nullable=True)
+    image_variants = db.Column(db.JSON, nullable=True)
     color = db.Column(db.String(20), nullable=True, default="red")
     zone = db.Column(db.String(100), nullable=True, default="")
     quantity = db.Column(db.Integer, nullable=True, default=1)
     warning = db.Column(db.String(255), nullable=True, default="")
     description = db.Column(db.Text, nullable=True)
     link = db.Column(db.String(500), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+    revision = db.Column(db.BigInteger, nullable=False, default=0)
+    # Normalized copy of the comma-separated `tags` string, kept in sync by tags.py
+    tag_set = db.relationship('Tag', secondary=item_tags, backref='items')
+
+    __table_args__ = (
+        db.Index('ix_item_map_id_revision', 'map_id', 'revision'),
+        db.Index('ix_item_map_id_x_coord_y_coord', 'map_id', 'x_coord', 'y_coord'),
+    )
+
+class ItemTombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, nullable=False)
+    map_id = db.Column(db.Integer, nullable=False)
+    revision = db.Column(db.BigInteger, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_item_tombstone_map_id_revision', 'map_id', 'revision'),
+    )
+
+class SyncState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.BigInteger, nullable=False, default=0)
+
+class Marker3D(db.Model):
+    __tablename__ = 'marker_3d'
+    id = db.Column(db.Integer, primary_key=True)
+    x = db.Column(db.Float, nullable=False)
+    y = db.Column(db.Float, nullable=False)
+    z = db.Column(db.Float, nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id', ondelete='CASCADE'), nullable=True)
+    map_id = db.Column(db.Integer, db.ForeignKey('map.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    item = db.relationship('Item', backref=db.backref('markers_3d', cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.Index('ix_marker_3d_item_id', 'item_id'),
+        db.Index('ix_marker_3d_map_id', 'map_id'),
+    )
@@ -0,0 +1,94 @@
+# pagination.py
+import base64
+import json
+import math
+from flask import current_app, request, stream_with_context
+from urllib.parse import urlencode
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_BATCH_SIZE = 200
+
+
+def encode_cursor(*key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(value: str, key_types=(int,)) -> tuple:
+    """Decode a cursor whose key must have one value of each of key_types
+    (int or float). Raises ValueError for anything else."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(key, list) or len(key) != len(key_types):
+        raise ValueError("invalid cursor")
+    for part, kind in zip(key, key_types):
+        # JSON numbers only: no strings, booleans, NaN or infinities
+        if isinstance(part, bool) or not isinstance(part, (int, float) if kind is float else int) \
+                or not math.isfinite(part):
+            raise ValueError("invalid cursor")
+    return tuple(kind(part) for part, kind in zip(key, key_types))
+
+
+def page_args(key_types=(int,)) -> tuple:
+    """(limit, cursor key) from the request. limit is None when the client
+    didn't ask for a page, which keeps the old unpaginated responses."""
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        return None, None
+    limit = max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+    return limit, decode_cursor(cursor, key_types) if cursor else None
+
+
+def after_id(query, column, cursor, limit: int):
+    """Keyset page over an integer id column: rows after the cursor's id,
+    one extra to tell whether another page follows."""
+    if cursor:
+        query = query.filter(column > cursor[0])
+    return query.order_by(column).limit(limit + 1)
+
+
+def split_page(rows: list, limit: int, key) -> tuple:
+    """Return (page, next_cursor), next_cursor None on the last page."""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(*key(page[-1]))
+
+
+def json_chunks(rows, serialize=None):
+    """Yield a JSON array of rows in pieces of STREAM_BATCH_SIZE rows."""
+    dumps = current_app.json.dumps
+    yield '['
+    batch = []
+    first = True
+    for row in rows:
+        batch.append(dumps(serialize(row) if serialize else row, separators=(',', ':')))
+        if len(batch) == STREAM_BATCH_SIZE:
+            yield (',' if not first else '') + ','.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield (',' if not first else '') + ','.join(batch)
+    yield ']'
+
+
+def json_stream_response(rows, serialize, next_cursor=None):
+    """Stream rows as a JSON array, serializing a batch at a time so the
+    whole body never sits in memory next to the rows. The next page's
+    cursor goes in X-Next-Cursor and a Link rel="next" header."""
+    response = current_app.response_class(stream_with_context(json_chunks(rows, serialize)),
+                                          mimetype='application/json')
+    add_next_link(response, next_cursor)
+    return response
+
+
+def add_next_link(response, next_cursor):
+    if next_cursor:
+        args = request.args.to_dict(flat=False)
+        args['cursor'] = [next_cursor]
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args, doseq=True)}>; rel="next"'
+    return response
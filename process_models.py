@@ -0,0 +1,33 @@
+# process_models.py
+import os
+from app import create_app
+from meshes import process_model, MAX_TEXTURE_SIZE, COARSE_CELLS
+
+DEFAULT_SOURCES = ('model.gltf',)
+
+
+def process_models(sources, max_texture=MAX_TEXTURE_SIZE, cells=COARSE_CELLS):
+    app = create_app()
+
+    with app.app_context():
+        for source in sources or [os.path.join(app.static_folder, name) for name in DEFAULT_SOURCES]:
+            try:
+                sizes = process_model(source, app.static_folder, max_texture=max_texture, cells=cells)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {source}: {str(e)}")
+                continue
+            original = os.path.getsize(source)
+            summary = ', '.join(f"{lod} {size} bytes" for lod, size in sizes.items())
+            print(f"Processed {source} ({original} bytes): {summary}")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write quantized and coarse GLB variants of 3D models")
+    parser.add_argument('sources', nargs='*', help="glTF/GLB files (default: static/model.gltf)")
+    parser.add_argument('--max-texture', type=int, default=MAX_TEXTURE_SIZE,
+                        help="downscale textures to at most this many pixels per side")
+    parser.add_argument('--cells', type=int, default=COARSE_CELLS,
+                        help="grid resolution for the coarse LOD")
+    args = parser.parse_args()
+    process_models(args.sources, args.max_texture, args.cells)
@@ -0,0 +1,71 @@
+# projection.py
+from sqlalchemy.orm import load_only
+from models import Item
+
+ITEM_FIELDS = ('id', 'name', 'tags', 'zone', 'color', 'quantity', 'warning', 'x_coord', 'y_coord',
+               'map_id', 'image_path', 'thumbnail_path', 'image_variants', 'image_available',
+               'description', 'link', 'revision', 'updated_at')
+# Defaults for /api/items/<id> and /api/search when fields= isn't given
+DETAIL_FIELDS = ('id', 'name', 'tags', 'x_coord', 'y_coord', 'map_id', 'image_path', 'thumbnail_path',
+                 'image_variants', 'image_available', 'color', 'quantity', 'warning', 'description', 'link')
+SEARCH_FIELDS = ('id', 'name', 'tags', 'x_coord', 'y_coord', 'map_id', 'image_path', 'thumbnail_path',
+                 'image_variants', 'image_available', 'description', 'link', 'quantity', 'warning')
+# Response fields computed from other columns
+DERIVED_COLUMNS = {'thumbnail_path': ('image_path', 'image_variants'),
+                   'image_available': ('image_path', 'image_variants')}
+ENCODINGS = ('json', 'columnar', 'msgpack')
+
+
+def parse_fields(value):
+    """Turn a fields=a,b,c argument into a tuple of field names, or None
+    when every field was asked for. Raises ValueError on unknown names."""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in ITEM_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    # The id is always included so clients can match results up
+    return tuple(dict.fromkeys(['id', *fields]))
+
+
+def column_options(fields) -> tuple:
+    """Query options loading only the columns the fields need."""
+    if not fields:
+        return ()
+    columns = []
+    for field in fields:
+        for column in DERIVED_COLUMNS.get(field, (field,)):
+            if column not in columns:
+                columns.append(column)
+    return (load_only(*(getattr(Item, column) for column in columns)),)
+
+
+def parse_encoding(value, accept=None) -> str:
+    encoding = (value or '').lower()
+    if not encoding:
+        encoding = 'msgpack' if accept and 'application/msgpack' in accept else 'json'
+    if encoding not in ENCODINGS:
+        raise ValueError(f"unsupported format '{encoding}', expected one of {', '.join(ENCODINGS)}")
+    if encoding == 'msgpack':
+        _msgpack()
+    return encoding
+
+
+def to_columns(rows: list, fields) -> dict:
+    """Arrays per field instead of an object per item: field names are sent
+    once rather than once per row."""
+    fields = fields or (list(rows[0]) if rows else ['id'])
+    return {"count": len(rows), "columns": {field: [row.get(field) for row in rows] for field in fields}}
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError("msgpack encoding is not available on this server")
+    return msgpack
+
+
+def pack(data) -> bytes:
+    return _msgpack().packb(data, use_bin_type=True)
@@ -0,0 +1,104 @@
+# retrieval.py
+import math
+import threading
+from collections import Counter
+from app import db
+from models import Item, ItemTombstone, Map
+from cache import get_version, ALL_ITEMS
+from search import tokenize
+
+# Repeat name and tag terms so they outweigh words in long descriptions
+FIELD_REPEATS = {'name': 3, 'tags': 2, 'description': 1}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class BM25Index:
+    """Okapi BM25 over every item's name, tags and description, updated in
+    place from the revision log instead of being rebuilt on each write."""
+
+    def __init__(self):
+        self.documents = {}  # item_id -> (term counts, length, item fields)
+        self.postings = {}   # term -> set of item ids
+        self.total_length = 0
+        self.cursor = -1
+        self.version = None
+
+    def add(self, item_id: int, fields: dict) -> None:
+        self.remove(item_id)
+        terms = Counter()
+        for field, repeats in FIELD_REPEATS.items():
+            for term in tokenize(fields.get(field)):
+                terms[term] += repeats
+        length = sum(terms.values())
+        self.documents[item_id] = (terms, length, fields)
+        self.total_length += length
+        for term in terms:
+            self.postings.setdefault(term, set()).add(item_id)
+
+    def remove(self, item_id: int) -> None:
+        document = self.documents.pop(item_id, None)
+        if document is None:
+            return
+        terms, length, _ = document
+        self.total_length -= length
+        for term in terms:
+            ids = self.postings[term]
+            ids.discard(item_id)
+            if not ids:
+                del self.postings[term]
+
+    def search(self, query: str, k: int) -> list:
+        """Return up to k (score, fields) pairs, best first."""
+        if not self.documents:
+            return []
+        n = len(self.documents)
+        average_length = self.total_length / n or 1
+        scores = Counter()
+        for term in set(tokenize(query)):
+            ids = self.postings.get(term)
+            if not ids:
+                continue
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            for item_id in ids:
+                terms, length, _ = self.documents[item_id]
+                tf = terms[term]
+                scores[item_id] += idf * tf * (BM25_K1 + 1) / (
+                    tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+        best = sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))[:k]
+        return [(score, self.documents[item_id][2]) for item_id, score in best]
+
+
+_index = BM25Index()
+_index_lock = threading.Lock()
+
+
+def _refresh(index: BM25Index) -> None:
+    version = get_version(ALL_ITEMS)
+    if version == index.version and index.cursor >= 0:
+        return
+    since = index.cursor
+    rows = (db.session.query(Item.id, Item.name, Item.tags, Item.description, Item.zone,
+                             Item.x_coord, Item.y_coord, Item.map_id, Map.name, Item.revision)
+            .join(Map, Item.map_id == Map.id)
+            .filter(Item.revision > since)
+            .all())
+    deleted = (db.session.query(ItemTombstone.item_id, ItemTombstone.revision)
+               .filter(ItemTombstone.revision > since)
+               .all())
+    # Tombstones first: a moved item has one for its old map but is still live
+    for item_id, _ in deleted:
+        index.remove(item_id)
+    for item_id, name, tags, description, zone, x, y, map_id, map_name, _ in rows:
+        index.add(item_id, {"id": item_id, "name": name, "tags": tags, "description": description,
+                            "zone": zone, "x_coord": x, "y_coord": y, "map_id": map_id,
+                            "map_name": map_name})
+    index.cursor = max([since, 0] + [row[-1] for row in rows] + [revision for _, revision in deleted])
+    index.version = version
+
+
+def relevant_items(query: str, k: int) -> list:
+    """Return the fields of the k items that best match the query."""
+    with _index_lock:
+        _refresh(_index)
+        return [fields for _, fields in _index.search(query, k)]
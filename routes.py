@@ -1,32 +1,121 @@
-from flask import Blueprint, request, jsonify, send_from_directory, current_app, render_template
+from flask import Blueprint, Response, request, jsonify, send_from_directory, current_app, render_template, stream_with_context, session
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import or_
+from werkzeug.exceptions import NotFound
 from werkzeug.utils import secure_filename
 from app import db
-from models import Map, Item
+from models import Map, Item, Marker3D
 import os
+import hashlib
+import json
 import uuid
-import datetime
+import zipfile
 import openai
 import logging
 from typing import Optional
-from chat import system_prompt, get_ai_response
+from chat import system_prompt, get_ai_response, stream_ai_response, reset_thread, answer_cache, ChatError
 from utils import list_available_items
+from images import pick_variant, DEFAULT_THUMBNAIL_SIZE
+from uploads import submit_item_image, submit_image_file, staging_folder
+from cache import cached_json_response, bump_version, ALL_ITEMS, MAPS, MARKERS
+from events import broker, item_changed
+from sync import changes_since
+from search import search_items
+from tags import filter_by_tags, tag_counts
+from spatial import bbox_query, nearest_items, parse_floats
+from clustering import cluster_items, MAX_ZOOM
+from manifest import image_index
+from tiles import tile_info, tile_root
+import assets
+import blobstore
+import bulk
+import markers
+import meshes
+import projection
+import pagination
 
 main_blueprint = Blueprint('main', __name__)
 
+MAX_NEAREST = 100
+
+def map_signature(*columns) -> str:
+    """Digest of the given Map columns across all maps. Maps are written by
+    the maintenance scripts in their own processes, which can't bump this
+    worker's MAPS version, so cached map responses are keyed on this."""
+    rows = db.session.query(Map.id, *columns).order_by(Map.id).all()
+    return hashlib.sha256(repr([tuple(row) for row in rows]).encode('utf-8')).hexdigest()[:16]
+
 @main_blueprint.route('/api/itemsList', methods=['GET'])
 def api_list_available_items():
-    items = list_available_items()
-    return jsonify(items), 200
-
-def generate_unique_filename(filename: Optional[str]) -> str:
-    if filename is None:
-        filename = "unnamed_file"
-    _, file_extension = os.path.splitext(filename)
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    random_string = str(uuid.uuid4())[:8]
-    return f"{timestamp}_{random_string}{file_extension}"
+    try:
+        limit, cursor = pagination.page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if limit is None:
+        return cached_json_response(('itemsList',), ALL_ITEMS, list_available_items)
+    items, next_cursor = pagination.split_page(
+        list_available_items(limit + 1, cursor[0] if cursor else None), limit, lambda item: (item["id"],))
+    return pagination.json_stream_response(items, lambda item: item, next_cursor)
+
+def requested_thumbnail_size() -> int:
+    return request.args.get('thumb_size', DEFAULT_THUMBNAIL_SIZE, type=int)
+
+def thumbnail_for(item, size: int) -> Optional[str]:
+    return pick_variant(item.image_variants, size,
+                        request.args.get('thumb_format', 'webp')) or item.image_path
+
+def item_field(item, field: str, thumb_size: int):
+    if field == 'thumbnail_path':
+        return thumbnail_for(item, thumb_size)
+    if field == 'image_available':
+        # Whether thumbnail_path resolves, so clients needn't probe it
+        return image_index.exists(current_app.config['UPLOAD_FOLDER'], thumbnail_for(item, thumb_size))
+    if field == 'updated_at':
+        return item.updated_at.isoformat() if item.updated_at else None
+    return getattr(item, field)
+
+def item_to_dict(item, thumb_size: int, fields=None) -> dict:
+    # Only touch the requested attributes; others may not have been loaded
+    return {field: item_field(item, field, thumb_size) for field in fields or projection.ITEM_FIELDS}
+
+def requested_projection() -> tuple:
+    """(fields, encoding) from the fields= and format= arguments; raises
+    ValueError when either is invalid."""
+    fields = projection.parse_fields(request.args.get('fields'))
+    encoding = projection.parse_encoding(request.args.get('format'), request.headers.get('Accept'))
+    return fields, encoding
+
+def encode_items(items: list, fields, encoding):
+    return items if encoding == 'json' else projection.to_columns(items, fields)
+
+def items_response(items: list, fields, encoding, thumb_size: int, next_cursor=None, extra_fields=()):
+    """Serialize items (or (item, extra fields) pairs) in the requested
+    encoding. Plain JSON is streamed. extra_fields names the extras so the
+    columnar header includes them."""
+    def serialize(entry):
+        if isinstance(entry, tuple):
+            return dict(item_to_dict(entry[0], thumb_size, fields), **entry[1])
+        return item_to_dict(entry, thumb_size, fields)
+
+    if encoding == 'json':
+        return pagination.json_stream_response(items, serialize, next_cursor)
+    data = encode_items([serialize(entry) for entry in items], fields and fields + tuple(extra_fields), encoding)
+    if encoding == 'msgpack':
+        response = Response(projection.pack(data), mimetype='application/msgpack')
+    else:
+        response = jsonify(data)
+    return pagination.add_next_link(response, next_cursor)
+
+def cached_items_response(key, scope, build, fields, encoding):
+    if encoding == 'msgpack':
+        return cached_json_response(key + (fields, encoding), scope,
+                                    lambda: encode_items(list(build()), fields, encoding),
+                                    projection.pack, 'application/msgpack')
+    if encoding == 'json':
+        # build() may be a lazy iterator; encode it a batch at a time
+        return cached_json_response(key + (fields, encoding), scope, build,
+                                    lambda rows: ''.join(pagination.json_chunks(rows)).encode('utf-8'))
+    return cached_json_response(key + (fields, encoding), scope,
+                                lambda: encode_items(list(build()), fields, encoding))
 
 @main_blueprint.before_request
 def log_request_info():
@@ -34,31 +123,141 @@ def log_request_info():
     
 @main_blueprint.route('/')
 def index():
+    # Only the map list is rendered in; items are loaded by script.js
     try:
-        items = Item.query.all()
-        return render_template('index.html', items=items)
+        # Keyed on every map column the page renders, since maps and their
+        # tiles are changed out of process, and on the asset build, since
+        # the page links fingerprinted URLs
+        asset_version = assets.manifest.version(current_app.static_folder)
+        maps_version = map_signature(Map.name, Map.svg_path, Map.background_color, Map.tile_size,
+                                     Map.tile_max_zoom, Map.tile_width, Map.tile_height, Map.tile_version)
+        return cached_json_response(('index', asset_version, maps_version), MAPS, lambda: render_template('index.html', maps=[{
+            "id": map.id,
+            "name": map.name,
+            "svg_path": map.svg_path,
+            "background_color": map.background_color,
+            "tiles": tile_info(map)
+        } for map in Map.query.order_by(Map.id)]), lambda html: html.encode('utf-8'), 'text/html')
     except SQLAlchemyError as e:
         current_app.logger.error(
-            f"Error fetching items for index page: {str(e)}")
-        return f"An error occurred while fetching items. : {str(e)}", 500
+            f"Error fetching maps for index page: {str(e)}")
+        return f"An error occurred while fetching maps. : {str(e)}", 500
 
 @main_blueprint.route('/3d')
 def threeDee():
-    return render_template('3d.html')
+    # Coarse LOD first, then the full model; the raw glTF if none were built
+    model_urls = meshes.model_urls(current_app.static_folder, 'model') or [assets.asset_url('model.gltf')]
+    return render_template('3d.html', model_urls=model_urls)
+
+@main_blueprint.route('/models/<name>/<lod>.glb')
+def model_file(name, lod):
+    if lod not in meshes.LODS:
+        return jsonify({"error": f"Unknown level of detail '{lod}'"}), 404
+    # Versioned URLs from model_urls() change whenever the file does
+    versioned = bool(request.args.get('v'))
+    try:
+        # conditional=True answers Range and If-None-Match/If-Modified-Since
+        response = send_from_directory(os.path.join(current_app.static_folder, meshes.MODEL_DIR),
+                                       f"{secure_filename(name)}.{lod}.glb", mimetype='model/gltf-binary',
+                                       conditional=True, max_age=assets.IMMUTABLE_MAX_AGE if versioned else None)
+    except NotFound:
+        return jsonify({"error": "Model not found"}), 404
+    if versioned:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
+@main_blueprint.route('/api/markers', methods=['POST'])
+def save_markers():
+    payload = request.get_json(silent=True)
+    rows = payload.get('markers') if isinstance(payload, dict) and 'markers' in payload else payload
+    if isinstance(rows, dict):
+        rows = [rows]
+    if not isinstance(rows, list) or not rows:
+        return jsonify({"error": "Expected a marker or a list of markers"}), 400
+    if len(rows) > markers.MAX_MARKERS:
+        return jsonify({"error": f"At most {markers.MAX_MARKERS} markers can be saved at once"}), 400
 
-@main_blueprint.route('/save_marker', methods=['POST'])
-def save_marker():
-    data = request.json
-    markers.append(data)  # Save marker coordinates
-    return jsonify(data)
+    try:
+        item_maps = markers.referenced_item_maps(row for row in rows if isinstance(row, dict))
+        map_ids = bulk.existing_map_ids()
+        valid, errors = [], []
+        for number, row in enumerate(rows, 1):
+            values, row_errors = markers.validate_marker(row, item_maps, map_ids)
+            if row_errors:
+                errors.append({"row": number, "errors": row_errors})
+            else:
+                valid.append(values)
+        if errors:
+            return jsonify({"created": 0, "errors": errors}), 422
+
+        ids = markers.insert_markers(valid)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error saving markers: {str(e)}")
+        return jsonify({"error": "An error occurred while saving markers"}), 500
+    bump_version(MARKERS)
+    return jsonify({"created": len(ids), "markers": [dict(values, id=marker_id)
+                                                     for marker_id, values in zip(ids, valid)]}), 201
 
-@main_blueprint.route('/get_markers')
+@main_blueprint.route('/api/markers', methods=['GET'])
 def get_markers():
-    return jsonify(markers=markers)
+    map_id = request.args.get('map_id', type=int)
+    item_id = request.args.get('item_id', type=int)
+
+    def build():
+        query = db.session.query(*(getattr(Marker3D, field) for field in markers.MARKER_FIELDS))
+        if map_id is not None:
+            query = query.filter(Marker3D.map_id == map_id)
+        if item_id is not None:
+            query = query.filter(Marker3D.item_id == item_id)
+        return [dict(zip(markers.MARKER_FIELDS, row)) for row in query.order_by(Marker3D.id)]
+
+    try:
+        return cached_json_response(('markers', map_id, item_id), MARKERS, build)
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Error fetching markers: {str(e)}")
+        return jsonify({"error": "An error occurred while fetching markers"}), 500
+
+@main_blueprint.route('/api/markers/nearest', methods=['GET'])
+def get_nearest_markers():
+    try:
+        x, y, z = (float(request.args[axis]) for axis in ('x', 'y', 'z'))
+        k = max(1, min(request.args.get('k', default=1, type=int), 100))
+        max_distance = float(request.args.get('max_distance', 'inf'))
+    except (KeyError, ValueError):
+        return jsonify({"error": "x, y and z are required numbers"}), 400
+    map_id = request.args.get('map_id', type=int)
+    try:
+        results = markers.nearest_markers(x, y, z, k, max_distance, map_id)
+        return jsonify([dict(markers.marker_to_dict(marker), distance=distance,
+                             item={"id": marker.item.id, "name": marker.item.name, "map_id": marker.item.map_id,
+                                   "x_coord": marker.item.x_coord, "y_coord": marker.item.y_coord}
+                             if marker.item else None)
+                        for marker, distance in results])
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Error finding nearest markers: {str(e)}")
+        return jsonify({"error": "An error occurred while finding markers"}), 500
+
+@main_blueprint.route('/api/markers/<int:marker_id>', methods=['DELETE'])
+def delete_marker(marker_id):
+    try:
+        deleted = Marker3D.query.filter_by(id=marker_id).delete()
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error deleting marker (ID: {marker_id}): {str(e)}")
+        return jsonify({"error": "An error occurred while deleting the marker"}), 500
+    if not deleted:
+        return jsonify({"error": "Marker not found"}), 404
+    bump_version(MARKERS)
+    return jsonify({"message": "Marker deleted successfully"}), 200
 
 @main_blueprint.route('/api/items/<int:item_id>', methods=['PUT'])
 def update_item(item_id):
     item = Item.query.get_or_404(item_id)
+    previous_map_id = item.map_id
     
     name = request.form.get('name')
     tags = request.form.get('tags')
@@ -95,17 +294,17 @@ def update_item(item_id):
     if link:
         item.link = link
 
-    if 'image' in request.files:
-        file = request.files['image']
-        if file and allowed_file(file.filename or ''):
-            filename = generate_unique_filename(secure_filename(file.filename or ''))
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            item.image_path = f'/static/thumbnails/{filename}'
+    image_file = request.files.get('image')
+    if image_file and not allowed_file(image_file.filename or ''):
+        image_file = None
 
     try:
         db.session.commit()
-        return jsonify({'message': 'Item updated successfully'}), 200
+        item_changed('updated', item.id, item.revision, previous_map_id, item.map_id)
+        if image_file:
+            submit_item_image(request, item.id, image_file)
+        return jsonify({'message': 'Item updated successfully',
+                        'image_pending': bool(image_file)}), 200
     except SQLAlchemyError as e:
         db.session.rollback()
         current_app.logger.error(f"Error updating item (ID: {item_id}): {str(e)}")
@@ -115,22 +314,14 @@ def update_item(item_id):
 def get_item(item_id):
     try:
         current_app.logger.info(f"Fetching item with ID: {item_id}")
-        item = Item.query.get_or_404(item_id)
-        image_path = item.image_path
-        return jsonify({
-            "id": item.id,
-            "name": item.name,
-            "tags": item.tags,
-            "x_coord": item.x_coord,
-            "y_coord": item.y_coord,
-            "map_id": item.map_id,
-            "image_path": image_path,
-            "color": item.color,
-            "quantity": item.quantity,
-            "warning": item.warning,
-            "description": item.description,
-            "link": item.link
-        }), 200
+        try:
+            fields = projection.parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        item = (Item.query.options(*projection.column_options(fields))
+                .filter_by(id=item_id).first_or_404())
+        return jsonify(item_to_dict(item, requested_thumbnail_size(),
+                                    fields or projection.DETAIL_FIELDS)), 200
     except SQLAlchemyError as e:
         current_app.logger.error(
             f"Error retrieving item (ID: {item_id}): {str(e)}")
@@ -141,11 +332,19 @@ def get_item(item_id):
 def get_maps():
     try:
         current_app.logger.info("Fetching all maps")
-        maps = Map.query.all()
-        return jsonify([{
+        try:
+            limit, cursor = pagination.page_args()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if limit is not None:
+            maps, next_cursor = pagination.split_page(
+                pagination.after_id(Map.query, Map.id, cursor, limit).all(), limit, lambda map: (map.id,))
+            return pagination.json_stream_response(maps, lambda map: {"id": map.id, "name": map.name},
+                                                   next_cursor)
+        return cached_json_response(('maps', map_signature(Map.name)), MAPS, lambda: [{
             "id": map.id,
             "name": map.name
-        } for map in maps])
+        } for map in Map.query.all()])
     except SQLAlchemyError as e:
         current_app.logger.error(f"Error fetching maps: {str(e)}")
         return jsonify({"error": "An error occurred while fetching maps"}), 500
@@ -158,7 +357,8 @@ def get_map(map_id):
         return jsonify({
             "id": map.id,
             "name": map.name,
-            "svg_path": map.svg_path
+            "svg_path": map.svg_path,
+            "tiles": tile_info(map)
         })
     except SQLAlchemyError as e:
         current_app.logger.error(
@@ -166,6 +366,38 @@ def get_map(map_id):
         return jsonify({"error":
                         "An error occurred while fetching the map"}), 500
 
+@main_blueprint.route('/api/maps/<int:map_id>/clusters', methods=['GET'])
+def get_clusters(map_id):
+    try:
+        zoom = max(0, min(request.args.get('zoom', 0, type=int), MAX_ZOOM))
+        return cached_json_response(('clusters', map_id, zoom), map_id,
+                                    lambda: cluster_items(map_id, zoom))
+    except SQLAlchemyError as e:
+        current_app.logger.error(
+            f"Error clustering items for map ID {map_id}: {str(e)}")
+        return jsonify({"error": "An error occurred while clustering items"}), 500
+
+@main_blueprint.route('/api/maps/<int:map_id>/events')
+def map_events(map_id):
+    heartbeat = current_app.config.get('EVENTS_HEARTBEAT', 15)
+    subscription = broker.subscribe(map_id)
+    current_app.logger.info(f"Event stream opened for map ID: {map_id}")
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = subscription.get(timeout=heartbeat)
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @main_blueprint.route('/api/items', methods=['GET', 'POST'])
 def items():
     if request.method == 'POST':
@@ -185,15 +417,6 @@ def items():
                 f"Missing required fields: {', '.join(missing_fields)}"
             }), 400
 
-        image_path = None
-        if image_file:
-            filename = generate_unique_filename(secure_filename(image_file.filename or ''))
-            image_path = os.path.join(current_app.config['UPLOAD_FOLDER'],
-                                      filename)
-            current_app.logger.info(f"Saving image to: {image_path}")
-            image_file.save(image_path)
-            image_path = f'/static/thumbnails/{filename}'
-
         try:
             new_item = Item()
             new_item.name = data['name']
@@ -205,14 +428,16 @@ def items():
             new_item.x_coord = float(data['x_coord'])
             new_item.y_coord = float(data['y_coord'])
             new_item.map_id = int(data['map_id'])
-            new_item.image_path = image_path
             new_item.description = data.get('description', '')
             new_item.link = data.get('link', '')
 
             db.session.add(new_item)
             db.session.commit()
+            item_changed('created', new_item.id, new_item.revision, new_item.map_id)
             current_app.logger.info(f"New item added with ID: {new_item.id}")
-            return jsonify({"id": new_item.id}), 201
+            if image_file:
+                submit_item_image(request, new_item.id, image_file)
+            return jsonify({"id": new_item.id, "image_pending": bool(image_file)}), 201
         except SQLAlchemyError as e:
             db.session.rollback()
             current_app.logger.error(f"Error adding item: {str(e)}")
@@ -226,30 +451,209 @@ def items():
                 current_app.logger.warning("Missing map_id in request")
                 return jsonify({"error": "map_id is required"}), 400
 
-            items = Item.query.filter_by(map_id=map_id).all()
-            return jsonify([
-                {
-                    "id": item.id,
-                    "name": item.name,
-                    "tags": item.tags,
-                    "zone": item.zone,
-                    "color": item.color,
-                    "quantity": item.quantity,
-                    "warning": item.warning,
-                    "x_coord": item.x_coord,
-                    "y_coord": item.y_coord,
-                    "map_id": item.map_id,
-                    "image_path": item.image_path,
-                    "description": item.description,
-                    "link": item.link
-                } for item in items
-            ])
+            thumb_size = requested_thumbnail_size()
+            thumb_format = request.args.get('thumb_format', 'webp')
+            tags = tuple(request.args.getlist('tag'))
+            try:
+                fields, encoding = requested_projection()
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            options = projection.column_options(fields)
+
+            bbox = request.args.get('bbox')
+            near = request.args.get('near')
+            try:
+                if near:
+                    # k already bounds the result; there is no next page
+                    x, y = parse_floats(near, 2)
+                    k = max(1, min(request.args.get('k', 10, type=int), MAX_NEAREST))
+                    return items_response([(item, {"distance": distance})
+                                           for item, distance in nearest_items(map_id, x, y, k, options)],
+                                          fields, encoding, thumb_size, extra_fields=('distance',))
+                if bbox:
+                    query = filter_by_tags(bbox_query(map_id, *parse_floats(bbox, 4)).options(*options), tags)
+                else:
+                    query = filter_by_tags(Item.query.options(*options).filter_by(map_id=map_id), tags)
+                limit, cursor = pagination.page_args()
+            except ValueError as e:
+                current_app.logger.warning(f"Invalid query parameters: {str(e)}")
+                return jsonify({"error": f"Invalid query parameters: {str(e)}"}), 400
+
+            if limit is not None:
+                items, next_cursor = pagination.split_page(
+                    pagination.after_id(query, Item.id, cursor, limit).all(), limit, lambda item: (item.id,))
+                return items_response(items, fields, encoding, thumb_size, next_cursor)
+            if bbox:
+                return items_response(query.all(), fields, encoding, thumb_size)
+
+            return cached_items_response(
+                ('items', map_id, thumb_size, thumb_format, tags), map_id,
+                lambda: (item_to_dict(item, thumb_size, fields)
+                         for item in query.order_by(Item.id).yield_per(pagination.STREAM_BATCH_SIZE)),
+                fields, encoding)
         except SQLAlchemyError as e:
             current_app.logger.error(
                 f"Error fetching items for map ID {map_id}: {str(e)}")
             return jsonify({"error":
                             "An error occurred while fetching items"}), 500
 
+@main_blueprint.route('/api/items/bulk', methods=['POST'])
+def bulk_import_items():
+    default_map_id = request.values.get('map_id', type=int)
+    partial = request.values.get('partial') in ('1', 'true')
+    try:
+        if request.is_json:
+            rows = request.get_json()
+            if not isinstance(rows, list):
+                return jsonify({"error": "Expected a JSON array of items"}), 400
+            bulk.check_row_count(rows)
+        else:
+            items_file = request.files.get('file')
+            if not items_file:
+                return jsonify({"error": "No items file provided"}), 400
+            fmt = bulk.detect_format(items_file.filename, request.values.get('format'))
+            rows = bulk.read_rows(items_file.stream, fmt)
+        image_zip = request.files.get('images')
+        archive = zipfile.ZipFile(image_zip.stream) if image_zip else None
+    except bulk.TooManyRowsError as e:
+        return jsonify({"error": str(e)}), 413
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({"error": str(e)}), 400
+
+    map_ids = bulk.existing_map_ids()
+    valid, errors = [], []
+    for number, row in enumerate(rows, 1):
+        values, row_errors = bulk.validate_row(row, map_ids, default_map_id)
+        if values and values.get('image') and (archive is None or values['image'] not in archive.NameToInfo):
+            row_errors.append(f"image '{values['image']}' is not in the zip")
+        if row_errors:
+            errors.append({"row": number, "errors": row_errors})
+        else:
+            valid.append(values)
+
+    if errors and not partial:
+        return jsonify({"created": 0, "errors": errors}), 422
+    if not valid:
+        return jsonify({"created": 0, "ids": [], "errors": errors}), 400
+
+    try:
+        ids, revision = bulk.insert_items(valid)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error importing items: {str(e)}")
+        return jsonify({"error": "An error occurred while importing items"}), 500
+
+    item_changed('created', None, revision, *{row['map_id'] for row in valid})
+    current_app.logger.info(f"Imported {len(ids)} items")
+
+    images_pending = 0
+    for item_id, row in zip(ids, valid):
+        if not row.get('image'):
+            continue
+        try:
+            path, extension = bulk.extract_image(archive, row['image'], staging_folder(),
+                                                 current_app.config['MAX_CONTENT_LENGTH'])
+        except ValueError as e:
+            current_app.logger.warning(f"Skipping image for item {item_id}: {str(e)}")
+            continue
+        submit_image_file(item_id, path, extension)
+        images_pending += 1
+
+    return jsonify({"created": len(ids), "ids": ids, "revision": revision,
+                    "errors": errors, "images_pending": images_pending}), 201
+
+@main_blueprint.route('/api/items', methods=['PATCH'])
+def batch_update_items():
+    try:
+        rows = bulk.expand_updates(request.get_json(silent=True))
+    except bulk.TooManyRowsError as e:
+        return jsonify({"error": str(e)}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    map_ids = bulk.existing_map_ids()
+    updates, errors = {}, []
+    for number, row in enumerate(rows, 1):
+        values, row_errors = bulk.validate_update(row, map_ids)
+        if not row_errors:
+            # Later changes to the same item win, field by field
+            updates.setdefault(values['id'], {}).update(values)
+        else:
+            errors.append({"row": number, "errors": row_errors})
+
+    previous_map_ids = bulk.current_map_ids(updates)
+    errors += [{"id": item_id, "errors": ["item not found"]}
+               for item_id in updates if item_id not in previous_map_ids]
+    if errors:
+        return jsonify({"updated": 0, "errors": errors}), 422
+    if not updates:
+        return jsonify({"updated": 0, "revision": None}), 200
+
+    try:
+        revision = bulk.update_items(list(updates.values()), previous_map_ids)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error updating items: {str(e)}")
+        return jsonify({"error": "An error occurred while updating items"}), 500
+
+    affected_maps = set(previous_map_ids.values()) | {
+        values['map_id'] for values in updates.values() if 'map_id' in values}
+    item_changed('updated', None, revision, *affected_maps)
+    current_app.logger.info(f"Batch updated {len(updates)} items at revision {revision}")
+    return jsonify({"updated": len(updates), "revision": revision}), 200
+
+@main_blueprint.route('/api/items/export', methods=['GET'])
+def export_items():
+    map_id = request.args.get('map_id', type=int)
+    try:
+        fmt = bulk.detect_format('', request.args.get('format', 'csv'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if fmt == 'json':
+        fmt = 'jsonl'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    filename = f"items-map-{map_id}.{fmt}" if map_id is not None else f"items.{fmt}"
+    return Response(stream_with_context(bulk.export_rows(map_id, fmt)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@main_blueprint.route('/api/items/changes', methods=['GET'])
+def item_changes():
+    try:
+        map_id = request.args.get('map_id', type=int)
+        since = request.args.get('since', 0, type=int)
+        if map_id is None:
+            current_app.logger.warning("Missing map_id in changes request")
+            return jsonify({"error": "map_id is required"}), 400
+
+        items, deleted_ids, cursor = changes_since(map_id, since)
+        current_app.logger.info(
+            f"Map {map_id} changes since {since}: {len(items)} upserted, {len(deleted_ids)} deleted")
+        thumb_size = requested_thumbnail_size()
+        return jsonify({
+            "cursor": cursor,
+            "upserted": [item_to_dict(item, thumb_size) for item in items],
+            "deleted": deleted_ids
+        })
+    except SQLAlchemyError as e:
+        current_app.logger.error(
+            f"Error fetching changes for map ID {map_id}: {str(e)}")
+        return jsonify({"error":
+                        "An error occurred while fetching item changes"}), 500
+
+@main_blueprint.route('/api/tags', methods=['GET'])
+def get_tags():
+    try:
+        map_id = request.args.get('map_id', type=int)
+        if map_id is None:
+            current_app.logger.warning("Missing map_id in tags request")
+            return jsonify({"error": "map_id is required"}), 400
+        return cached_json_response(('tags', map_id), map_id, lambda: tag_counts(map_id))
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Error fetching tags for map ID {map_id}: {str(e)}")
+        return jsonify({"error": "An error occurred while fetching tags"}), 500
+
 @main_blueprint.route('/api/items/<int:item_id>', methods=['DELETE'])
 def delete_item(item_id):
     try:
@@ -260,8 +664,13 @@ def delete_item(item_id):
             current_app.logger.warning(
                 f"Attempt to delete non-existent item with id: {item_id}")
             return jsonify({"error": "Item not found"}), 404
+        image_path = item.image_path
+        map_id = item.map_id
         db.session.delete(item)
         db.session.commit()
+        item_changed('deleted', item_id, None, map_id)
+        if blobstore.release(image_path, current_app.config['UPLOAD_FOLDER']):
+            image_index.invalidate()
         current_app.logger.info(f"Item with id {item_id} deleted successfully")
         return jsonify({"message": "Item deleted successfully"}), 200
     except SQLAlchemyError as e:
@@ -271,12 +680,38 @@ def delete_item(item_id):
         return jsonify({"error":
                         "An error occurred while deleting the item"}), 500
 
+@main_blueprint.route('/api/images/manifest', methods=['GET'])
+def image_manifest():
+    map_id = request.args.get('map_id', type=int)
+    if map_id is None:
+        return jsonify({"error": "map_id is required"}), 400
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+
+    def build():
+        images = {}
+        rows = (db.session.query(Item.id, Item.image_path, Item.image_variants)
+                .filter(Item.map_id == map_id).order_by(Item.id))
+        for item_id, image_path, variants in rows:
+            urls = [image_path] + [url for variant in (variants or {}).values() for url in variant.values()]
+            for url in filter(None, urls):
+                if url not in images:
+                    images[url] = image_index.describe(upload_folder, url)
+        return {"map_id": map_id, "images": images}
+
+    try:
+        # Keyed on the directory listing too, so out-of-band file changes show up
+        signature = image_index.refresh(upload_folder)
+        return cached_json_response(('manifest', map_id, signature), map_id, build)
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Error building image manifest for map {map_id}: {str(e)}")
+        return jsonify({"error": "An error occurred while building the image manifest"}), 500
+
 @main_blueprint.route('/api/search')
 def search():
     try:
         query = request.args.get('q', '')
         search_type = request.args.get('type', 'all')
-        map_id = request.args.get('map_id')
+        map_id = request.args.get('map_id', type=int)
 
         current_app.logger.info(
             f"Search query: {query}, type: {search_type}, map_id: {map_id}")
@@ -285,35 +720,28 @@ def search():
             current_app.logger.warning("Missing map_id in search request")
             return jsonify({"error": "map_id is required"}), 400
 
-        items_query = Item.query.filter(Item.map_id == map_id)
-
-        if search_type == 'name':
-            items_query = items_query.filter(Item.name.ilike(f'%{query}%'))
-        elif search_type == 'tags':
-            items_query = items_query.filter(Item.tags.ilike(f'%{query}%'))
-        else:  # 'all'
-            items_query = items_query.filter(
-                or_(Item.name.ilike(f'%{query}%'),
-                    Item.tags.ilike(f'%{query}%')))
+        try:
+            fields, encoding = requested_projection()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        items = items_query.all()
+        try:
+            # Search pages continue after the last (score, id)
+            limit, cursor = pagination.page_args((float, int))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        results = search_items(map_id, query, search_type, request.args.getlist('tag'),
+                               projection.column_options(fields), limit, cursor)
+        next_cursor = None
+        if limit is not None:
+            results, next_cursor = pagination.split_page(results, limit,
+                                                         lambda result: (result[0], result[1].id))
         current_app.logger.info(
-            f"Found {len(items)} items matching search criteria")
-        return jsonify([
-            {
-                "id": item.id,
-                "name": item.name,
-                "tags": item.tags,
-                "x_coord": item.x_coord,
-                "y_coord": item.y_coord,
-                "map_id": item.map_id,
-                "image_path": item.image_path,
-                "description": item.description,
-                "link": item.link,
-                "quantity": item.quantity,
-                "warning": item.warning
-            } for item in items
-        ])
+            f"Found {len(results)} items matching search criteria")
+        thumb_size = requested_thumbnail_size()
+        fields = fields or projection.SEARCH_FIELDS
+        return items_response([item for _, item in results], fields, encoding, thumb_size, next_cursor)
     except SQLAlchemyError as e:
         current_app.logger.error(f"Error searching items: {str(e)}")
         return jsonify(
@@ -322,17 +750,38 @@ def search():
 @main_blueprint.route('/static/<path:filename>')
 def static_files(filename):
     return send_from_directory('static', filename)
-    
+
+@main_blueprint.route('/static/dist/<path:filename>')
+def fingerprinted_static(filename):
+    # Names change with content, so these never need revalidating
+    return assets.send_fingerprinted(filename)
+
+@main_blueprint.route('/tiles/<int:map_id>/<version>/<int:z>/<int:x>/<int:y>.webp')
+def map_tile(map_id, version, z, x, y):
+    # The version is a content hash, so a tile URL never changes meaning
+    try:
+        response = send_from_directory(tile_root(current_app.static_folder, map_id),
+                                       f"{secure_filename(version)}/{z}/{x}/{y}.webp",
+                                       mimetype='image/webp', max_age=assets.IMMUTABLE_MAX_AGE)
+    except NotFound:
+        return jsonify({"error": "Tile not found"}), 404
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 @main_blueprint.route('/static/maps/<path:filename>')
 def serve_static(filename):
-    file_path = os.path.join(current_app.static_folder, 'maps', filename)
-    current_app.logger.info(f"Attempting to serve static file: {file_path}")
-    if not os.path.exists(file_path):
-        current_app.logger.warning(
-            f"Attempt to access non-existent file: {file_path}")
+    try:
+        return send_from_directory(os.path.join(current_app.static_folder, 'maps'), filename)
+    except NotFound:
+        current_app.logger.warning(f"Attempt to access non-existent map file: {filename}")
         return jsonify({"error": "File not found"}), 404
-    return send_from_directory(os.path.join(current_app.static_folder, 'maps'),
-                               filename)
+
+@main_blueprint.app_errorhandler(413)
+def upload_too_large(e):
+    limit = current_app.config.get('MAX_CONTENT_LENGTH')
+    current_app.logger.warning(f"Rejected request larger than {limit} bytes")
+    return jsonify({"error": f"Upload exceeds the {limit} byte limit"}), 413
 
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webm'}
@@ -350,10 +799,43 @@ def chat():
 
         current_app.logger.info(f"Sending message to AI: {user_message}")
 
-        ai_message = get_ai_response(user_message)
+        # Only an opaque key lives in the cookie; the thread id stays server-side
+        session_key = session.setdefault('chat_session', uuid.uuid4().hex)
+        if data.get('reset'):
+            reset_thread(session_key)
+
+        wants_stream = data.get('stream') or request.accept_mimetypes.best == 'text/event-stream'
+        if wants_stream:
+            tokens = stream_ai_response(user_message, session_key)
+
+            def stream():
+                try:
+                    for token in tokens:
+                        yield f"data: {json.dumps({'token': token})}\n\n"
+                    yield "event: done\ndata: {}\n\n"
+                except ChatError as e:
+                    current_app.logger.error(f"AI response stream failed: {str(e)}")
+                    yield f"event: error\ndata: {json.dumps({'error': 'The assistant could not finish its answer'})}\n\n"
+                except Exception as e:
+                    # Assistant setup, grounding and thread creation run on the
+                    # first iteration, after the response has started
+                    current_app.logger.error(f"Unexpected error in chat stream: {str(e)}")
+                    yield f"event: error\ndata: {json.dumps({'error': 'An unexpected error occurred while processing your request'})}\n\n"
+
+            return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+        ai_message = get_ai_response(user_message, session_key)
         current_app.logger.info(f"Received response from AI: {ai_message}")
         return jsonify({"message": ai_message})
 
+    except ChatError as e:
+        current_app.logger.error(f"AI response failed: {str(e)}")
+        return jsonify({"error": "The assistant could not answer right now. Please try again."}), 502
     except Exception as e:
         current_app.logger.error(f"Unexpected error in chat API: {str(e)}")
-        return jsonify({"error": "An unexpected error occurred while processing your request"}), 500
\ No newline at end of file
+        return jsonify({"error": "An unexpected error occurred while processing your request"}), 500
+
+@main_blueprint.route('/api/chat/cache', methods=['GET'])
+def chat_cache_stats():
+    return jsonify(answer_cache.stats())
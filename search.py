@@ -0,0 +1,181 @@
+# search.py
+import bisect
+import re
+import threading
+from collections import defaultdict
+from sqlalchemy import REAL, and_, func, literal, literal_column, or_, text
+from app import db
+from models import Item
+from cache import get_version
+from tags import filter_by_tags
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+FIELD_WEIGHTS = {'name': 3.0, 'tags': 2.0, 'description': 1.0}
+SEARCH_FIELDS = {'all': ('name', 'tags', 'description'), 'name': ('name',), 'tags': ('tags',)}
+PREFIX_PENALTY = 0.7
+TYPO_PENALTY = 0.4
+TRIGRAM_THRESHOLD = 0.3
+
+# Must match the expression index created in migration c3e8a5b6d1f2
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(tags, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+)
+TSQUERY_WEIGHTS = {'all': '', 'name': 'A', 'tags': 'B'}
+
+
+def tokenize(value) -> list:
+    return TOKEN.findall((value or '').lower())
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up early once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class InvertedIndex:
+    """Per-map in-memory index used when the database isn't Postgres."""
+
+    def __init__(self, rows):
+        # postings[field][term] -> {item_id: term frequency}
+        self.postings = {field: defaultdict(dict) for field in FIELD_WEIGHTS}
+        for item_id, *values in rows:
+            for field, value in zip(FIELD_WEIGHTS, values):
+                for term in tokenize(value):
+                    counts = self.postings[field][term]
+                    counts[item_id] = counts.get(item_id, 0) + 1
+        self.terms = sorted({term for field in self.postings.values() for term in field})
+
+    def _expand(self, token: str) -> list:
+        """Return (term, penalty) pairs matching token exactly, by prefix
+        or, when nothing else matches, within a small edit distance."""
+        matches = []
+        start = bisect.bisect_left(self.terms, token)
+        for term in self.terms[start:]:
+            if not term.startswith(token):
+                break
+            matches.append((term, 1.0 if term == token else PREFIX_PENALTY))
+        if matches or len(token) < 4:
+            return matches
+        limit = 1 if len(token) < 7 else 2
+        return [(term, TYPO_PENALTY) for term in self.terms
+                if edit_distance(token, term[:len(token) + limit], limit) <= limit]
+
+    def search(self, query: str, fields) -> list:
+        """Return (score, item_id) pairs, best first."""
+        scores = None
+        for token in tokenize(query):
+            token_scores = defaultdict(float)
+            for term, penalty in self._expand(token):
+                for field in fields:
+                    for item_id, count in self.postings[field].get(term, {}).items():
+                        token_scores[item_id] += FIELD_WEIGHTS[field] * penalty * (1 + count) / 2
+            if scores is None:
+                scores = token_scores
+            else:
+                # Every query term has to match somewhere
+                scores = {item_id: score + token_scores[item_id]
+                          for item_id, score in scores.items() if item_id in token_scores}
+            if not scores:
+                return []
+        return sorted(((score, item_id) for item_id, score in scores.items()),
+                      key=lambda entry: (-entry[0], entry[1]))
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(map_id: int) -> InvertedIndex:
+    version = get_version(map_id)
+    with _indexes_lock:
+        cached = _indexes.get(map_id)
+    if cached and cached[0] == version:
+        return cached[1]
+    rows = (db.session.query(Item.id, Item.name, Item.tags, Item.description)
+            .filter(Item.map_id == map_id).all())
+    index = InvertedIndex(rows)
+    with _indexes_lock:
+        _indexes[map_id] = (version, index)
+    return index
+
+
+def _postgres_search(map_id: int, query: str, search_type: str, tags, options, limit=None, cursor=None):
+    tokens = tokenize(query)
+    weight = TSQUERY_WEIGHTS.get(search_type, '')
+    tsquery = func.to_tsquery('simple', ' & '.join(f"{token}:*{weight}" for token in tokens))
+    vector = literal_column(SEARCH_VECTOR)
+    if search_type == 'tags':
+        similarity = func.similarity(func.coalesce(Item.tags, ''), query)
+    else:
+        similarity = func.similarity(Item.name, query)
+    rank = (func.ts_rank(vector, tsquery) + similarity).label('rank')
+
+    db.session.execute(text("SELECT set_config('pg_trgm.similarity_threshold', :threshold, true)"),
+                       {"threshold": str(TRIGRAM_THRESHOLD)})
+    typo_match = (func.coalesce(Item.tags, '').op('%')(query) if search_type == 'tags'
+                  else Item.name.op('%')(query))
+    results = (filter_by_tags(db.session.query(Item, rank).options(*options), tags)
+               .filter(Item.map_id == map_id)
+               .filter(or_(vector.op('@@')(tsquery), typo_match)))
+    if cursor:
+        # rank is a real; compare it as one so the cursor value round-trips exactly
+        last_rank = literal(float(cursor[0]), REAL)
+        results = results.filter(or_(rank < last_rank, and_(rank == last_rank, Item.id > int(cursor[1]))))
+    results = results.order_by(rank.desc(), Item.id)
+    if limit is not None:
+        results = results.limit(limit + 1)
+    return [(float(score), item) for item, score in results]
+
+
+def _index_search(map_id: int, query: str, search_type: str, tags, options, limit=None, cursor=None):
+    ranked = get_index(map_id).search(query, SEARCH_FIELDS[search_type])
+    if cursor:
+        last = (-float(cursor[0]), int(cursor[1]))
+        ranked = [entry for entry in ranked if (-entry[0], entry[1]) > last]
+    wanted = len(ranked) if limit is None else limit + 1
+    results = []
+    # Tag filters can drop candidates, so keep loading until the page is full
+    chunk_size = max(wanted, 1)
+    for start in range(0, len(ranked), chunk_size):
+        chunk = ranked[start:start + chunk_size]
+        items = {item.id: item for item in
+                 filter_by_tags(Item.query.options(*options), tags)
+                 .filter(Item.id.in_([item_id for _, item_id in chunk]))}
+        results += [(score, items[item_id]) for score, item_id in chunk if item_id in items]
+        if len(results) >= wanted:
+            break
+    return results[:wanted]
+
+
+def search_items(map_id: int, query: str, search_type: str = 'all', tags=(), options=(),
+                 limit=None, cursor=None) -> list:
+    """Return (score, item) pairs, best first. options are applied to the
+    item query, e.g. to load fewer columns. With a limit, at most limit + 1
+    results after the (score, id) cursor are returned."""
+    if search_type not in SEARCH_FIELDS:
+        search_type = 'all'
+    if not tokenize(query):
+        results = filter_by_tags(Item.query.options(*options), tags).filter(Item.map_id == map_id)
+        if cursor:
+            results = results.filter(Item.id > int(cursor[1]))
+        results = results.order_by(Item.id)
+        if limit is not None:
+            results = results.limit(limit + 1)
+        return [(0.0, item) for item in results]
+
+    if db.engine.dialect.name == 'postgresql':
+        return _postgres_search(map_id, query, search_type, tags, options, limit, cursor)
+    return _index_search(map_id, query, search_type, tags, options, limit, cursor)
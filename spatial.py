@@ -0,0 +1,116 @@
+# spatial.py
+import heapq
+import math
+import threading
+from collections import defaultdict
+from app import db
+from models import Item
+from cache import get_version
+
+# Map coordinates are image pixels; anything past this is not on a map
+MAX_COORDINATE = 100000
+
+
+class GridIndex:
+    """Uniform grid over a map's item coordinates for nearest-N lookups."""
+
+    def __init__(self, points):
+        self.points = points
+        self.cells = defaultdict(list)
+        if not points:
+            self.cell_size = 1.0
+            self.bounds = (0, 0, 0, 0)
+            return
+        xs = [x for _, x, _ in points]
+        ys = [y for _, _, y in points]
+        extent = max(max(xs) - min(xs), max(ys) - min(ys), 1.0)
+        # Roughly one point per cell on average
+        self.cell_size = extent / max(1.0, math.sqrt(len(points)))
+        for point in points:
+            self.cells[self._cell(point[1], point[2])].append(point)
+        keys = self.cells.keys()
+        self.bounds = (min(k[0] for k in keys), min(k[1] for k in keys),
+                       max(k[0] for k in keys), max(k[1] for k in keys))
+
+    def _cell(self, x: float, y: float) -> tuple:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def _ring(self, cx: int, cy: int, radius: int):
+        if radius == 0:
+            yield cx, cy
+            return
+        for i in range(-radius, radius + 1):
+            yield cx + i, cy - radius
+            yield cx + i, cy + radius
+        for j in range(-radius + 1, radius):
+            yield cx - radius, cy + j
+            yield cx + radius, cy + j
+
+    def nearest(self, x: float, y: float, k: int) -> list:
+        """Return up to k (distance, item_id) pairs, closest first."""
+        if not self.points or k <= 0:
+            return []
+        cx, cy = self._cell(x, y)
+        min_cx, min_cy, max_cx, max_cy = self.bounds
+        if not (min_cx <= cx <= max_cx and min_cy <= cy <= max_cy):
+            # Rings around a far-away point are mostly empty; a scan is cheaper
+            return heapq.nsmallest(k, ((math.hypot(px - x, py - y), item_id)
+                                       for item_id, px, py in self.points))
+        max_radius = max(abs(cx - min_cx), abs(cx - max_cx), abs(cy - min_cy), abs(cy - max_cy))
+        heap = []  # max-heap of the k best as (-distance, -item_id)
+        for radius in range(max_radius + 1):
+            for cell in self._ring(cx, cy, radius):
+                for item_id, px, py in self.cells.get(cell, ()):
+                    entry = (-math.hypot(px - x, py - y), -item_id)
+                    if len(heap) < k:
+                        heapq.heappush(heap, entry)
+                    elif entry > heap[0]:
+                        heapq.heapreplace(heap, entry)
+            # Anything in an outer ring is at least radius * cell_size away
+            if len(heap) == k and -heap[0][0] <= radius * self.cell_size:
+                break
+        return sorted((-d, -item_id) for d, item_id in heap)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_grid(map_id: int) -> GridIndex:
+    version = get_version(map_id)
+    with _indexes_lock:
+        cached = _indexes.get(map_id)
+    if cached and cached[0] == version:
+        return cached[1]
+    points = (db.session.query(Item.id, Item.x_coord, Item.y_coord)
+              .filter(Item.map_id == map_id).all())
+    grid = GridIndex([tuple(point) for point in points])
+    with _indexes_lock:
+        _indexes[map_id] = (version, grid)
+    return grid
+
+
+def parse_floats(value: str, count: int) -> tuple:
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != count or not all(math.isfinite(part) for part in parts):
+        raise ValueError(f"expected {count} comma-separated numbers")
+    if any(abs(part) > MAX_COORDINATE for part in parts):
+        raise ValueError(f"coordinates must be within ±{MAX_COORDINATE}")
+    return tuple(parts)
+
+
+def bbox_query(map_id: int, x0: float, y0: float, x1: float, y1: float):
+    # Served by the (map_id, x_coord, y_coord) index
+    return Item.query.filter(Item.map_id == map_id,
+                             Item.x_coord.between(min(x0, x1), max(x0, x1)),
+                             Item.y_coord.between(min(y0, y1), max(y0, y1)))
+
+
+def nearest_items(map_id: int, x: float, y: float, k: int, options=()) -> list:
+    """Return (item, distance) pairs for the k items closest to (x, y)."""
+    matches = get_grid(map_id).nearest(x, y, k)
+    if not matches:
+        return []
+    items = {item.id: item for item in
+             Item.query.options(*options).filter(Item.id.in_([i for _, i in matches]))}
+    return [(items[item_id], distance) for distance, item_id in matches if item_id in items]
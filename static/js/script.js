@@ -34,16 +34,21 @@ document.addEventListener('DOMContentLoaded', function() {
         messageDiv.innerHTML = `<div class="message-content">${marked.parse(message)}</div>`;
         chatMessages.appendChild(messageDiv);
         chatMessages.scrollTop = chatMessages.scrollHeight;
+        return messageDiv;
     }
 
     const loadingSpinner = document.getElementById('loadingSpinner');
 
+    let chatHasStarted = false;
+
     function sendChatMessage() {
         const message = userInput.value.trim();
         if (message) {
 
             addMessage(message, true);
             userInput.value = '';
+            const chatStarted = chatHasStarted;
+            chatHasStarted = true;
             const parentDiv = loadingSpinner.parentElement;
             parentDiv.appendChild(loadingSpinner);
             loadingSpinner.style.display = 'block';
@@ -52,25 +57,83 @@ document.addEventListener('DOMContentLoaded', function() {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream, application/json',
                 },
-                body: JSON.stringify({ message: message }),
+                // A fresh page starts a fresh conversation on the server too
+                body: JSON.stringify({ message: message, stream: true, reset: !chatStarted }),
             })
-            .then(response => response.json())
-            .then(data => {
-                loadingSpinner.style.display = 'none';
-                if (data.error) {
-                    addMessage('Error: ' + data.error);
-                } else {
-                    addMessage(data.message);
+            .then(response => {
+                const isStream = (response.headers.get('Content-Type') || '').startsWith('text/event-stream');
+                if (isStream && response.body && response.body.getReader) {
+                    return readChatStream(response.body.getReader());
                 }
+                return response.json().then(data => {
+                    loadingSpinner.style.display = 'none';
+                    if (data.error) {
+                        addMessage('Error: ' + data.error);
+                    } else {
+                        addMessage(data.message);
+                    }
+                });
             })
             .catch(error => {
                 console.error('Error:', error);
+                loadingSpinner.style.display = 'none';
                 addMessage('Error occurred while sending message');
             });
         }
     }
 
+    function readChatStream(reader) {
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+        let messageDiv = null;
+
+        function handleEvent(block) {
+            let eventName = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (!data) return;
+            const payload = JSON.parse(data);
+            if (eventName === 'error') {
+                loadingSpinner.style.display = 'none';
+                addMessage('Error: ' + payload.error);
+            } else if (eventName === 'message' && payload.token) {
+                answer += payload.token;
+                if (!messageDiv) {
+                    loadingSpinner.style.display = 'none';
+                    messageDiv = addMessage(answer);
+                } else {
+                    messageDiv.querySelector('.message-content').innerHTML = marked.parse(answer);
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                }
+            }
+        }
+
+        function pump() {
+            return reader.read().then(({ done, value }) => {
+                if (done) {
+                    loadingSpinner.style.display = 'none';
+                    return;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                const blocks = buffer.split('\n\n');
+                buffer = blocks.pop();
+                blocks.forEach(handleEvent);
+                return pump();
+            });
+        }
+
+        return pump();
+    }
+
     if (sendMessage) {
         sendMessage.addEventListener('click', sendChatMessage);
     }
@@ -88,6 +151,21 @@ document.addEventListener('DOMContentLoaded', function() {
     let selectedLocation = null;
     let scale = 1;
     let currentMapId = null;
+    let syncCursor = 0;
+    let eventSource = null;
+    let syncTimer = null;
+    const LIST_THUMB_SIZE = 64;
+    const DETAILS_THUMB_SIZE = '1024';
+    const IMAGE_PROCESSING_DELAY = 2000;
+    const SEARCH_DEBOUNCE_DELAY = 150;
+    const CLUSTER_THRESHOLD = 200;
+    const CLUSTER_CELL_PIXELS = 24;
+    const CLUSTER_BASE_CELL_SIZE = 256;
+    let clusters = null;
+    const mapDetails = {};
+    // Tile pyramid of the current map (see tiles.py), or null to draw mapImage
+    let mapTiles = null;
+    let redrawPending = false;
 
     mapImage.onload = function() {
         resizeCanvas();
@@ -111,14 +189,22 @@ document.addEventListener('DOMContentLoaded', function() {
         itemTagsInput.addEventListener('keydown', submitOnEnter);
     }
 
+    // Map size in item coordinates
+    function mapSize() {
+        return mapTiles ? { width: mapTiles.width, height: mapTiles.height }
+                        : { width: mapImage.width, height: mapImage.height };
+    }
+
     function resizeCanvas() {
         if (mapCanvas) {
             const container = mapCanvas.parentElement;
             const containerWidth = container.clientWidth;
+            const size = mapSize();
             mapCanvas.width = containerWidth;
-            mapCanvas.height = (mapImage.height / mapImage.width) * containerWidth;
-            scale = containerWidth / mapImage.width;
+            mapCanvas.height = (size.height / size.width) * containerWidth;
+            scale = containerWidth / size.width;
             drawMap();
+            loadClusters();
         }
     }
 
@@ -128,17 +214,25 @@ document.addEventListener('DOMContentLoaded', function() {
 
     function drawMap() {
         
-        if (ctx && mapImage.complete && mapImage.naturalHeight !== 0) {
+        if (ctx && (mapTiles || (mapImage.complete && mapImage.naturalHeight !== 0))) {
             ctx.clearRect(0, 0, mapCanvas.width, mapCanvas.height);
-            ctx.drawImage(mapImage, 0, 0, mapCanvas.width, mapCanvas.height);
-            items.forEach(item => {
-                const snappedX = snapTo5x(item.x_coord);
-                const snappedY = snapTo5x(item.y_coord);
-                ctx.fillStyle = 'green';
-                ctx.beginPath();
-                ctx.arc(snappedX * scale, snappedY * scale, 5, 0, 2 * Math.PI);
-                ctx.fill();
-            });
+            if (mapTiles) {
+                drawTiles();
+            } else {
+                ctx.drawImage(mapImage, 0, 0, mapCanvas.width, mapCanvas.height);
+            }
+            if (clusters) {
+                drawClusters();
+            } else {
+                items.forEach(item => {
+                    const snappedX = snapTo5x(item.x_coord);
+                    const snappedY = snapTo5x(item.y_coord);
+                    ctx.fillStyle = 'green';
+                    ctx.beginPath();
+                    ctx.arc(snappedX * scale, snappedY * scale, 5, 0, 2 * Math.PI);
+                    ctx.fill();
+                });
+            }
             if (selectedLocation) {
                 ctx.fillStyle = 'blue';
                 ctx.beginPath();
@@ -150,8 +244,77 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    function loadMaps() {
-        fetch('/api/maps')
+    function scheduleRedraw() {
+        if (redrawPending) return;
+        redrawPending = true;
+        requestAnimationFrame(() => {
+            redrawPending = false;
+            drawMap();
+        });
+    }
+
+    // Draw the coarsest pyramid level that still covers the canvas at full
+    // resolution, fetching only that level's tiles and redrawing as they arrive
+    function drawTiles() {
+        const pixels = mapCanvas.width * (window.devicePixelRatio || 1);
+        let zoom = mapTiles.max_zoom;
+        while (zoom > 0 && mapTiles.width / 2 ** (mapTiles.max_zoom - zoom + 1) >= pixels) {
+            zoom--;
+        }
+        if (mapTiles.zoom !== zoom) {
+            mapTiles.zoom = zoom;
+            mapTiles.images = {};
+        }
+        const levelScale = 2 ** (mapTiles.max_zoom - zoom);
+        const tileSize = mapTiles.tile_size;
+        const columns = Math.ceil(mapTiles.width / levelScale / tileSize);
+        const rows = Math.ceil(mapTiles.height / levelScale / tileSize);
+        for (let x = 0; x < columns; x++) {
+            for (let y = 0; y < rows; y++) {
+                let tile = mapTiles.images[`${x}/${y}`];
+                if (!tile) {
+                    tile = new Image();
+                    tile.onload = scheduleRedraw;
+                    tile.src = mapTiles.url.replace('{z}', zoom).replace('{x}', x).replace('{y}', y);
+                    mapTiles.images[`${x}/${y}`] = tile;
+                }
+                if (tile.complete && tile.naturalWidth !== 0) {
+                    // One tile pixel is levelScale map units
+                    const unit = levelScale * scale;
+                    ctx.drawImage(tile, x * tileSize * unit, y * tileSize * unit,
+                                  tile.naturalWidth * unit, tile.naturalHeight * unit);
+                }
+            }
+        }
+    }
+
+    function drawClusters() {
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'middle';
+        clusters.forEach(cluster => {
+            const radius = cluster.count > 1 ? 6 + 2 * Math.log2(cluster.count) : 5;
+            ctx.fillStyle = 'green';
+            ctx.beginPath();
+            ctx.arc(cluster.x * scale, cluster.y * scale, radius, 0, 2 * Math.PI);
+            ctx.fill();
+            if (cluster.count > 1) {
+                ctx.fillStyle = 'white';
+                ctx.font = '10px sans-serif';
+                ctx.fillText(cluster.count, cluster.x * scale, cluster.y * scale);
+            }
+        });
+    }
+
+    function loadClusters() {
+        const searching = searchInput && searchInput.value.trim() !== '';
+        if (!currentMapId || searching || items.length <= CLUSTER_THRESHOLD) {
+            clusters = null;
+            return;
+        }
+
+        const cellSize = CLUSTER_CELL_PIXELS / scale;
+        const zoom = Math.max(0, Math.round(Math.log2(CLUSTER_BASE_CELL_SIZE / cellSize)));
+        fetch(`/api/maps/${currentMapId}/clusters?zoom=${zoom}`)
             .then(response => {
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
@@ -159,21 +322,52 @@ document.addEventListener('DOMContentLoaded', function() {
                 return response.json();
             })
             .then(data => {
-                mapSelector.innerHTML = '<option value="">Select a map</option>';
-                data.forEach(map => {
-                    const option = document.createElement('option');
-                    option.value = map.id;
-                    option.textContent = map.name;
-                   
-                    mapSelector.appendChild(option);
-                });
+                clusters = data.clusters;
+                drawMap();
+            })
+            .catch(error => {
+                console.error('Error loading clusters:', error);
+                clusters = null;
+            });
+    }
+
+    function populateMaps(data) {
+        mapSelector.innerHTML = '<option value="">Select a map</option>';
+        data.forEach(map => {
+            mapDetails[map.id] = map;
+            const option = document.createElement('option');
+            option.value = map.id;
+            option.textContent = map.name;
+
+            mapSelector.appendChild(option);
+        });
 
-                const iLabOption = Array.from(mapSelector.options).find(option => option.text === 'iLab');
-                if (iLabOption) {
-                    mapSelector.value = iLabOption.value;
-                    mapSelector.dispatchEvent(new Event('change'));
+        const iLabOption = Array.from(mapSelector.options).find(option => option.text === 'iLab');
+        if (iLabOption) {
+            mapSelector.value = iLabOption.value;
+            mapSelector.dispatchEvent(new Event('change'));
+        }
+    }
+
+    function loadMaps() {
+        // The page shell embeds the map list, saving a round trip at startup
+        const bootstrapData = document.getElementById('mapsData');
+        if (bootstrapData) {
+            try {
+                populateMaps(JSON.parse(bootstrapData.textContent));
+                return;
+            } catch (error) {
+                console.error('Invalid embedded map list:', error);
+            }
+        }
+        fetch('/api/maps')
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
                 }
+                return response.json();
             })
+            .then(populateMaps)
             .catch(error => {
                 console.error('Error loading maps:', error);
                 displayErrorMessage('Error loading maps. Please try again later.');
@@ -183,7 +377,7 @@ document.addEventListener('DOMContentLoaded', function() {
     function loadItems() {
         if (!currentMapId) return;
         
-        fetch(`/api/items?map_id=${currentMapId}`)
+        fetch(`/api/items?map_id=${currentMapId}&thumb_size=${LIST_THUMB_SIZE}`)
             .then(response => {
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
@@ -192,8 +386,10 @@ document.addEventListener('DOMContentLoaded', function() {
             })
             .then(data => {
                 items = data;
+                syncCursor = data.reduce((max, item) => Math.max(max, item.revision || 0), 0);
                 updateItemList();
                 drawMap();
+                loadClusters();
             })
             .catch(error => {
                 console.error('Error loading items:', error);
@@ -201,6 +397,54 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
+    function syncItems() {
+        if (!currentMapId) return;
+        if (searchInput && searchInput.value.trim() !== '') {
+            performSearch();
+            return;
+        }
+
+        fetch(`/api/items/changes?map_id=${currentMapId}&since=${syncCursor}&thumb_size=${LIST_THUMB_SIZE}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(data => {
+                const replaced = new Set(data.deleted);
+                data.upserted.forEach(item => replaced.add(item.id));
+                items = items.filter(item => !replaced.has(item.id)).concat(data.upserted);
+                syncCursor = data.cursor;
+                updateItemList();
+                drawMap();
+                loadClusters();
+            })
+            .catch(error => {
+                console.error('Error syncing items:', error);
+                loadItems();
+            });
+    }
+
+    function scheduleSync() {
+        clearTimeout(syncTimer);
+        syncTimer = setTimeout(syncItems, 100);
+    }
+
+    function subscribeToMapEvents() {
+        if (eventSource) {
+            eventSource.close();
+            eventSource = null;
+        }
+        if (!currentMapId || !window.EventSource) return;
+
+        eventSource = new EventSource(`/api/maps/${currentMapId}/events`);
+        ['item.created', 'item.updated', 'item.deleted'].forEach(type => {
+            eventSource.addEventListener(type, scheduleSync);
+        });
+        eventSource.addEventListener('resync', loadItems);
+    }
+
     function updateItemList() {
         items.sort((a, b) => a.name.localeCompare(b.name));
         itemList.innerHTML = '';
@@ -216,17 +460,9 @@ document.addEventListener('DOMContentLoaded', function() {
             imageNameContainer.classList.add('d-flex', 'align-items-center');
 
             const imageElement = document.createElement('img');
-            fetch(item.image_path, { method: 'HEAD' })
-                .then(response => {
-                    if (response.ok) {
-                        imageElement.src = item.image_path;
-                    } else {
-                        imageElement.src = '/static/img/default.png'; // Path to default image
-                    }
-                })
-                .catch(() => {
-                    imageElement.src = '/static/img/default.png'; // Path to default image
-                });
+            const thumbnailPath = item.thumbnail_path || item.image_path;
+            // The server reports whether the file exists, so no HEAD probe is needed
+            imageElement.src = item.image_available && thumbnailPath ? thumbnailPath : '/static/img/default.png';
             imageElement.width = 60;
             imageElement.height = 60;
             imageElement.alt = item.name;
@@ -341,7 +577,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 return response.json();
             })
             .then(data => {
-                loadItems();
+                syncItems();
                 displaySuccessMessage(data.message || 'Item deleted successfully');
             })
             .catch(error => {
@@ -364,7 +600,7 @@ document.addEventListener('DOMContentLoaded', function() {
     function performSearch() {
         const query = searchInput.value.toLowerCase();
         const type = searchType.value;
-        fetch(`/api/search?q=${encodeURIComponent(query)}&type=${type}&map_id=${currentMapId}`)
+        fetch(`/api/search?q=${encodeURIComponent(query)}&type=${type}&map_id=${currentMapId}&thumb_size=${LIST_THUMB_SIZE}`)
             .then(response => {
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
@@ -374,6 +610,7 @@ document.addEventListener('DOMContentLoaded', function() {
             .then(data => {
                 items = data;
                 updateItemList();
+                loadClusters();
                 drawMap();
             })
             .catch(error => {
@@ -449,7 +686,8 @@ document.addEventListener('DOMContentLoaded', function() {
 
         const modal = new bootstrap.Modal(document.getElementById('itemDetailsModal'));
 
-        document.getElementById('itemDetailsImage').src = item.image_path;
+        const detailsVariant = item.image_variants && item.image_variants[DETAILS_THUMB_SIZE];
+        document.getElementById('itemDetailsImage').src = detailsVariant ? detailsVariant.webp : item.image_path;
         document.getElementById('itemDetailsName').textContent = item.name;
         document.getElementById('itemDetailsTags').textContent = item.tags;
         document.getElementById('itemDetailsQuantity').textContent = `Quantity: ${item.quantity}`;
@@ -568,7 +806,10 @@ document.addEventListener('DOMContentLoaded', function() {
         .then(data => {
             console.log('Item updated successfully:', data);
             addItemForm.style.display = 'none';
-            loadItems();
+            syncItems();
+            if (data.image_pending) {
+                setTimeout(syncItems, IMAGE_PROCESSING_DELAY);
+            }
             displaySuccessMessage('Item updated successfully');
             resetForm();
             selectedLocation = null;
@@ -637,7 +878,10 @@ document.addEventListener('DOMContentLoaded', function() {
             if (addItemForm) {
                 addItemForm.style.display = 'none';
             }
-            loadItems();
+            syncItems();
+            if (data.image_pending) {
+                setTimeout(syncItems, IMAGE_PROCESSING_DELAY);
+            }
             resetForm();
             displaySuccessMessage('Item added successfully');
         })
@@ -670,8 +914,13 @@ document.addEventListener('DOMContentLoaded', function() {
         updateItemBtn.removeAttribute('data-item-id');
     }
 
+    let searchTimer = null;
+
     if (searchInput) {
-        searchInput.addEventListener('input', performSearch);
+        searchInput.addEventListener('input', function() {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(performSearch, SEARCH_DEBOUNCE_DELAY);
+        });
     }
 
     if (searchType) {
@@ -762,22 +1011,32 @@ document.addEventListener('DOMContentLoaded', function() {
     if (mapSelector) {
         mapSelector.addEventListener('change', function() {
             currentMapId = this.value;
+            subscribeToMapEvents();
             if (currentMapId) {
-                fetch(`/api/maps/${currentMapId}`)
-                    .then(response => {
-                        if (!response.ok) {
-                            throw new Error(`HTTP error! status: ${response.status}`);
-                        }
-                        return response.json();
-                    })
+                const known = mapDetails[currentMapId];
+                const details = known && known.svg_path ? Promise.resolve(known) :
+                    fetch(`/api/maps/${currentMapId}`)
+                        .then(response => {
+                            if (!response.ok) {
+                                throw new Error(`HTTP error! status: ${response.status}`);
+                            }
+                            return response.json();
+                        });
+                details
                     .then(data => {
-                        // Hard-code SVG to PNG
-                        let imagePath = data.svg_path.replace('.svg', '.png');
-                        mapImage.src = imagePath;
-                        mapImage.onload = function() {
+                        mapTiles = data.tiles ? Object.assign({ zoom: null, images: {} }, data.tiles) : null;
+                        if (mapTiles) {
                             resizeCanvas();
                             loadItems();
-                        };
+                        } else {
+                            // Hard-code SVG to PNG
+                            let imagePath = data.svg_path.replace('.svg', '.png');
+                            mapImage.src = imagePath;
+                            mapImage.onload = function() {
+                                resizeCanvas();
+                                loadItems();
+                            };
+                        }
                         if (mapCanvas) {
                             mapCanvas.style.backgroundColor = data.background_color;
                         }
@@ -879,7 +1138,10 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(data => {
             console.log('Image updated successfully');
-            loadItems();
+            syncItems();
+            if (data.image_pending) {
+                setTimeout(syncItems, IMAGE_PROCESSING_DELAY);
+            }
             displaySuccessMessage('Item image updated successfully');
         })
         .catch(error => {
@@ -0,0 +1,63 @@
+# sync.py
+from sqlalchemy import event, insert, inspect, update
+from app import db
+from models import Item, ItemTombstone, SyncState
+
+
+def next_revision(session, count: int = 1) -> int:
+    """Reserve `count` revisions and return the last one.
+
+    The counter is a single row, so on Postgres the UPDATE holds its row lock
+    until the transaction commits. Revisions therefore become visible in
+    order and a client cursor can never skip over a slower commit."""
+    sync_state = SyncState.__table__
+    revision = session.execute(
+        update(sync_state)
+        .where(sync_state.c.id == 1)
+        .values(revision=sync_state.c.revision + count)
+        .returning(sync_state.c.revision)
+    ).scalar()
+    if revision is None:
+        session.execute(insert(sync_state).values(id=1, revision=count))
+        revision = count
+    return revision
+
+
+@event.listens_for(db.session, 'before_flush')
+def stamp_item_revisions(session, flush_context, instances):
+    changed = [obj for obj in session.new if isinstance(obj, Item)]
+    changed += [obj for obj in session.dirty
+                if isinstance(obj, Item) and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Item)]
+    if not changed and not deleted:
+        return
+
+    revision = next_revision(session)
+    for item in changed:
+        item.revision = revision
+        # An item moved to another map disappears from the old one
+        previous_map_ids = inspect(item).attrs.map_id.history.deleted
+        for previous_map_id in previous_map_ids:
+            if previous_map_id is not None and previous_map_id != item.map_id:
+                session.add(ItemTombstone(item_id=item.id, map_id=previous_map_id, revision=revision))
+    for item in deleted:
+        session.add(ItemTombstone(item_id=item.id, map_id=item.map_id, revision=revision))
+
+
+def changes_since(map_id: int, since: int) -> tuple:
+    """Return (items, deleted_item_ids, cursor) for everything on the map
+    that changed after revision `since`."""
+    items = (Item.query
+             .filter(Item.map_id == map_id, Item.revision > since)
+             .order_by(Item.revision)
+             .all())
+    tombstones = (ItemTombstone.query
+                  .filter(ItemTombstone.map_id == map_id, ItemTombstone.revision > since)
+                  .order_by(ItemTombstone.revision)
+                  .all())
+
+    live_ids = {item.id for item in items}
+    # Later re-inserts win over earlier tombstones for the same id
+    deleted_ids = sorted({t.item_id for t in tombstones} - live_ids)
+    cursor = max([since] + [item.revision for item in items] + [t.revision for t in tombstones])
+    return items, deleted_ids, cursor
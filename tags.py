@@ -0,0 +1,85 @@
+# tags.py
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import Item, Tag, item_tags
+
+MAX_TAG_LENGTH = 100
+
+
+def parse_tags(tags) -> list:
+    """Split a comma-separated tag string into unique, normalized names,
+    preserving their order."""
+    names = []
+    for raw in (tags or '').split(','):
+        name = ' '.join(raw.split()).lower()[:MAX_TAG_LENGTH]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _get_or_create_tags(session, names: list) -> list:
+    if not names:
+        return []
+    dialect = session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        session.execute(insert(Tag.__table__)
+                        .values([{"name": name} for name in names])
+                        .on_conflict_do_nothing(index_elements=['name']))
+        with session.no_autoflush:
+            existing = {tag.name: tag for tag in Tag.query.filter(Tag.name.in_(names))}
+    else:
+        with session.no_autoflush:
+            existing = {tag.name: tag for tag in Tag.query.filter(Tag.name.in_(names))}
+        for name in names:
+            if name not in existing:
+                existing[name] = Tag(name=name)
+                session.add(existing[name])
+    return [existing[name] for name in names]
+
+
+def link_item_tags(session, tags_by_item: dict) -> None:
+    """Insert item_tags rows for items written without the ORM (bulk
+    inserts skip the before_flush hook below). tags_by_item maps item ids
+    to comma-separated tag strings."""
+    parsed = {item_id: parse_tags(tags) for item_id, tags in tags_by_item.items()}
+    names = list(dict.fromkeys(name for names in parsed.values() for name in names))
+    if not names:
+        return
+    tags = _get_or_create_tags(session, names)
+    session.flush()
+    tag_ids = {tag.name: tag.id for tag in tags}
+    session.execute(item_tags.insert(), [{"item_id": item_id, "tag_id": tag_ids[name]}
+                                         for item_id, names in parsed.items() for name in names])
+
+
+@event.listens_for(db.session, 'before_flush')
+def sync_item_tags(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Item):
+            continue
+        if obj not in session.new and not inspect(obj).attrs.tags.history.has_changes():
+            continue
+        obj.tag_set = _get_or_create_tags(session, parse_tags(obj.tags))
+
+
+def filter_by_tags(query, tags):
+    """Restrict an Item query to items carrying every one of the given tags."""
+    for name in parse_tags(','.join(tags)):
+        query = query.filter(Item.id.in_(
+            select(item_tags.c.item_id)
+            .join(Tag, Tag.id == item_tags.c.tag_id)
+            .where(Tag.name == name)))
+    return query
+
+
+def tag_counts(map_id: int) -> list:
+    rows = (db.session.query(Tag.name, func.count(item_tags.c.item_id))
+            .join(item_tags, item_tags.c.tag_id == Tag.id)
+            .join(Item, Item.id == item_tags.c.item_id)
+            .filter(Item.map_id == map_id)
+            .group_by(Tag.name)
+            .order_by(func.count(item_tags.c.item_id).desc(), Tag.name)
+            .all())
+    return [{"name": name, "count": count} for name, count in rows]
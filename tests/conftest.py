@@ -0,0 +1,27 @@
+# tests/conftest.py
+import os
+import tempfile
+import pytest
+
+# create_app() reads these, and chat.py builds its OpenAI client on import
+_workdir = tempfile.mkdtemp(prefix='ilabmap-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+
+from app import create_app, db
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
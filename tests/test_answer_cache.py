@@ -0,0 +1,28 @@
+# tests/test_answer_cache.py
+import pytest
+from answer_cache import AnswerCache
+
+
+def test_cache_answers_repeated_and_reworded_questions():
+    cache = AnswerCache(max_entries=4, similarity=0.5)
+    cache.put('Where is the laser cutter?', 'ctx', 'By the back wall.')
+    assert cache.get('where is the LASER cutter', 'ctx') == 'By the back wall.'
+    assert cache.get('laser cutter location?', 'ctx') == 'By the back wall.'
+    # Only served while the question retrieves the same context
+    assert cache.get('Where is the laser cutter?', 'other') is None
+
+
+def test_least_recently_used_answer_is_dropped():
+    cache = AnswerCache(max_entries=2, similarity=0)
+    for n in range(3):
+        cache.put(f'question {n}', 'ctx', f'answer {n}')
+    assert cache.get('question 0', 'ctx') is None
+    assert cache.get('question 2', 'ctx') == 'answer 2'
+
+
+@pytest.mark.parametrize('max_entries', [0, -1])
+def test_zero_size_disables_the_cache(max_entries):
+    cache = AnswerCache(max_entries=max_entries)
+    cache.put('Where is the laser cutter?', 'ctx', 'By the back wall.')
+    assert cache.get('Where is the laser cutter?', 'ctx') is None
+    assert cache.stats()['entries'] == 0
@@ -0,0 +1,84 @@
+# tests/test_blobstore.py
+import os
+import time
+import pytest
+import blobstore
+from app import db
+from models import Item, Map
+
+
+def write(folder, name: str, data: bytes):
+    path = folder / name
+    path.write_bytes(data)
+    return path
+
+
+def store_blob(upload_folder, data: bytes) -> str:
+    filename, _ = blobstore.store_file(str(write(upload_folder, 'upload.part', data)), '.jpg', str(upload_folder))
+    return f"/static/thumbnails/{filename}"
+
+
+def age(upload_folder, image_path: str, seconds: float) -> None:
+    path = os.path.join(upload_folder, os.path.basename(image_path))
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def blob_exists(upload_folder, image_path: str) -> bool:
+    return os.path.exists(os.path.join(upload_folder, os.path.basename(image_path)))
+
+
+@pytest.fixture
+def upload_folder(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(blobstore, '_deferred', {})
+    return tmp_path
+
+
+def test_release_deletes_unreferenced_blob_after_grace(upload_folder):
+    image_path = store_blob(upload_folder, b'old photo')
+    age(upload_folder, image_path, blobstore.GC_GRACE_SECONDS + 1)
+    assert blobstore.release(image_path, str(upload_folder))
+    assert not blob_exists(upload_folder, image_path)
+
+
+def test_release_inside_grace_is_retried_by_later_release(upload_folder):
+    image_path = store_blob(upload_folder, b'replaced right away')
+    assert not blobstore.release(image_path, str(upload_folder))
+    assert blob_exists(upload_folder, image_path)
+
+    # Once the grace period has passed, the next release sweeps it
+    age(upload_folder, image_path, blobstore.GC_GRACE_SECONDS + 1)
+    blobstore._deferred[(str(upload_folder), image_path)] = time.time() - 1
+    other = store_blob(upload_folder, b'another photo')
+    assert not blobstore.release(other, str(upload_folder))
+    assert not blob_exists(upload_folder, image_path)
+
+
+def test_deferred_release_keeps_blob_referenced_again(upload_folder):
+    image_path = store_blob(upload_folder, b'uploaded again')
+    assert not blobstore.release(image_path, str(upload_folder))
+    map = Map(name='Blobs', svg_path='/static/maps/main.svg')
+    db.session.add(map)
+    db.session.flush()
+    db.session.add(Item(name='camera', x_coord=1, y_coord=1, map_id=map.id, image_path=image_path))
+    db.session.commit()
+    try:
+        age(upload_folder, image_path, blobstore.GC_GRACE_SECONDS + 1)
+        blobstore._deferred[(str(upload_folder), image_path)] = time.time() - 1
+        assert blobstore.retry_deferred(str(upload_folder)) == 0
+        assert blob_exists(upload_folder, image_path)
+        assert not blobstore._deferred
+    finally:
+        Item.query.filter_by(map_id=map.id).delete()
+        db.session.delete(map)
+        db.session.commit()
+
+
+def test_deferred_release_runs_on_its_own(upload_folder, monkeypatch):
+    monkeypatch.setattr(blobstore, 'GC_GRACE_SECONDS', 0.1)
+    image_path = store_blob(upload_folder, b'deleted within the grace period')
+    assert not blobstore.release(image_path, str(upload_folder))
+    deadline = time.monotonic() + 5
+    while blob_exists(upload_folder, image_path) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert not blob_exists(upload_folder, image_path)
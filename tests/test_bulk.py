@@ -0,0 +1,67 @@
+# tests/test_bulk.py
+import io
+import pytest
+import bulk
+from app import db
+from models import Item, Map
+
+
+@pytest.fixture
+def map_id(app):
+    map = Map(name='Imports', svg_path='/static/maps/main.svg')
+    db.session.add(map)
+    db.session.commit()
+    yield map.id
+    Item.query.filter_by(map_id=map.id).delete()
+    db.session.delete(map)
+    db.session.commit()
+
+
+def rows(count: int, map_id: int) -> list:
+    return [{"name": f"bin {n}", "x_coord": n, "y_coord": 0, "map_id": map_id} for n in range(count)]
+
+
+def csv_file(items: list):
+    lines = ['name,x_coord,y_coord,map_id'] + [f"{row['name']},{row['x_coord']},0,{row['map_id']}" for row in items]
+    return io.BytesIO('\n'.join(lines).encode()), 'items.csv'
+
+
+@pytest.mark.parametrize('as_json', [True, False])
+def test_import_rejects_more_than_max_rows(client, map_id, as_json):
+    items = rows(bulk.MAX_ROWS + 1, map_id)
+    if as_json:
+        response = client.post('/api/items/bulk', json=items)
+    else:
+        response = client.post('/api/items/bulk', data={"file": csv_file(items)})
+    assert response.status_code == 413
+    assert str(bulk.MAX_ROWS) in response.get_json()['error']
+    assert Item.query.filter_by(map_id=map_id).count() == 0
+
+
+@pytest.mark.parametrize('as_json', [True, False])
+def test_import_accepts_max_rows(client, map_id, as_json):
+    items = rows(bulk.MAX_ROWS, map_id)
+    if as_json:
+        response = client.post('/api/items/bulk', json=items)
+    else:
+        response = client.post('/api/items/bulk', data={"file": csv_file(items)})
+    assert response.status_code == 201, response.get_json()
+    assert Item.query.filter_by(map_id=map_id).count() == bulk.MAX_ROWS
+
+
+@pytest.mark.parametrize('payload', [
+    lambda ids: {"ids": ids, "set": {"zone": "B"}},
+    lambda ids: [{"id": item_id, "zone": "B"} for item_id in ids],
+])
+def test_batch_update_rejects_more_than_max_rows(client, map_id, payload):
+    response = client.patch('/api/items', json=payload(list(range(1, bulk.MAX_ROWS + 2))))
+    assert response.status_code == 413
+    assert str(bulk.MAX_ROWS) in response.get_json()['error']
+
+
+def test_batch_update_selection_within_limit(client, map_id):
+    client.post('/api/items/bulk', json=rows(3, map_id))
+    ids = [item.id for item in Item.query.filter_by(map_id=map_id)]
+    response = client.patch('/api/items', json={"ids": ids, "set": {"zone": "B"}})
+    assert response.get_json()['updated'] == 3
+    assert {item.zone for item in Item.query.filter_by(map_id=map_id)} == {'B'}
@@ -0,0 +1,186 @@
+# tests/test_chat.py
+import json
+import threading
+from types import SimpleNamespace
+import pytest
+import chat
+from answer_cache import AnswerCache
+from chat import ChatError
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        return iter(self.events)
+
+
+class FakeRuns:
+    """Runs report the given statuses in turn, the last one repeating."""
+
+    def __init__(self, statuses=('completed',), events=()):
+        self.statuses = list(statuses)
+        self.events = events
+        self.retrieved = 0
+        self.cancelled = []
+        self.created = []
+
+    def create(self, thread_id, assistant_id, stream=False, **kwargs):
+        self.created.append({"thread_id": thread_id, "assistant_id": assistant_id, "stream": stream, **kwargs})
+        if stream:
+            return FakeStream(self.events)
+        return SimpleNamespace(id='run_1', status='queued')
+
+    def retrieve(self, thread_id, run_id):
+        status = self.statuses[min(self.retrieved, len(self.statuses) - 1)]
+        self.retrieved += 1
+        return SimpleNamespace(id=run_id, status=status, last_error=None)
+
+    def cancel(self, thread_id, run_id):
+        self.cancelled.append(run_id)
+
+
+class FakeThreads:
+    def __init__(self, runs, answer='Use the laser cutter.', error=None):
+        self.runs = runs
+        self.error = error
+        self.messages = SimpleNamespace(list=lambda thread_id, run_id: SimpleNamespace(data=[
+            SimpleNamespace(content=[SimpleNamespace(text=SimpleNamespace(value=answer))])]))
+
+    def create(self):
+        if self.error:
+            raise self.error
+        return SimpleNamespace(id='thread_1')
+
+
+def event(name, data=None):
+    return SimpleNamespace(event=name, data=data)
+
+
+def delta(text):
+    return event('thread.message.delta', SimpleNamespace(delta=SimpleNamespace(content=[
+        SimpleNamespace(type='text', text=SimpleNamespace(value=text))])))
+
+
+@pytest.fixture
+def fake_client(app, monkeypatch):
+    """Install a fake assistants client; tests fill in its runs."""
+    def install(runs, **kwargs):
+        threads = FakeThreads(runs, **kwargs)
+        monkeypatch.setattr(chat, 'client', SimpleNamespace(beta=SimpleNamespace(threads=threads)))
+        return threads
+    monkeypatch.setattr(chat, 'assistant', SimpleNamespace(id='asst_test'))
+    monkeypatch.setattr(chat, 'answer_cache', AnswerCache(max_entries=16, similarity=0.9))
+    monkeypatch.setattr(chat, 'grounding_context', lambda message: "No iLab items matched this message.")
+    monkeypatch.setattr(chat.time, 'sleep', lambda seconds: None)
+    return install
+
+
+def test_wait_for_run_returns_completed_run(fake_client):
+    runs = FakeRuns(['queued', 'in_progress', 'completed'])
+    fake_client(runs)
+    assert chat.wait_for_run('thread_1', 'run_1').status == 'completed'
+    assert runs.retrieved == 3
+    assert runs.cancelled == []
+
+
+@pytest.mark.parametrize('status', ['failed', 'cancelled', 'expired'])
+def test_wait_for_run_raises_for_unsuccessful_runs(fake_client, status):
+    runs = FakeRuns(['in_progress', status])
+    fake_client(runs)
+    with pytest.raises(ChatError, match=status):
+        chat.wait_for_run('thread_1', 'run_1')
+    assert runs.cancelled == []
+
+
+def test_wait_for_run_cancels_on_timeout(fake_client):
+    runs = FakeRuns(['in_progress'])
+    fake_client(runs)
+    with pytest.raises(ChatError, match='timed out'):
+        chat.wait_for_run('thread_1', 'run_1', timeout=0)
+    assert runs.cancelled == ['run_1']
+
+
+def test_get_ai_response_waits_for_run(fake_client):
+    runs = FakeRuns(['queued', 'completed'])
+    fake_client(runs, answer='Ask staff for safety glasses.')
+    assert chat.get_ai_response('Where are the safety glasses?') == 'Ask staff for safety glasses.'
+    assert runs.created[0]['assistant_id'] == 'asst_test'
+
+
+def test_stream_ai_response_yields_tokens_and_caches_answer(fake_client):
+    runs = FakeRuns(events=[event('thread.run.created', SimpleNamespace(id='run_1')),
+                            delta('Use '), delta('the 3D printer.'), event('thread.run.completed')])
+    fake_client(runs)
+    assert list(chat.stream_ai_response('How do I print a part?')) == ['Use ', 'the 3D printer.']
+    assert runs.created[0]['stream'] is True
+    # The same opening question is then answered from the cache
+    assert list(chat.stream_ai_response('How do I print a part?')) == ['Use the 3D printer.']
+    assert len(runs.created) == 1
+
+
+def test_stream_ai_response_raises_for_failed_run(fake_client):
+    runs = FakeRuns(events=[event('thread.run.created', SimpleNamespace(id='run_1')),
+                            delta('Use '), event('thread.run.failed')])
+    fake_client(runs)
+    tokens = chat.stream_ai_response('How do I print a part?')
+    assert next(tokens) == 'Use '
+    with pytest.raises(ChatError, match='thread.run.failed'):
+        next(tokens)
+
+
+def test_stream_ai_response_times_out(fake_client):
+    released = threading.Event()
+
+    def stalled():
+        # Nothing arrives until the test lets the worker finish
+        released.wait(5)
+        yield event('thread.run.created', SimpleNamespace(id='run_1'))
+
+    runs = FakeRuns(events=stalled())
+    fake_client(runs)
+    try:
+        with pytest.raises(ChatError, match='timed out'):
+            list(chat.stream_ai_response('How do I print a part?', timeout=0.05))
+    finally:
+        released.set()
+
+
+def sse_events(response) -> list:
+    try:
+        body = response.get_data(as_text=True)
+    finally:
+        response.close()
+    events = []
+    for block in filter(None, body.split('\n\n')):
+        lines = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((lines.get('event', 'message'), json.loads(lines['data'])))
+    return events
+
+
+def test_chat_stream_route_sends_tokens(client, fake_client):
+    fake_client(FakeRuns(events=[delta('Hello'), delta(' there')]))
+    response = client.post('/api/chat', json={"message": "Hi", "stream": True})
+    assert response.mimetype == 'text/event-stream'
+    assert sse_events(response) == [('message', {"token": "Hello"}), ('message', {"token": " there"}),
+                                    ('done', {})]
+
+
+def test_chat_stream_route_reports_failed_run(client, fake_client):
+    fake_client(FakeRuns(events=[event('thread.run.expired')]))
+    response = client.post('/api/chat', json={"message": "Hi", "stream": True})
+    assert [kind for kind, _ in sse_events(response)] == ['error']
+
+
+def test_chat_stream_route_reports_unexpected_errors(client, fake_client):
+    # Thread creation only happens once the response has started streaming
+    fake_client(FakeRuns(), error=RuntimeError('connection reset'))
+    response = client.post('/api/chat', json={"message": "Hi", "stream": True})
+    assert [kind for kind, _ in sse_events(response)] == ['error']
@@ -0,0 +1,43 @@
+# tests/test_maps.py
+import pytest
+from app import db
+from models import Map
+
+
+@pytest.fixture
+def map(app):
+    map = Map(name='Workshop', svg_path='/static/maps/main.svg', background_color='white')
+    db.session.add(map)
+    db.session.commit()
+    yield map
+    db.session.delete(db.session.get(Map, map.id))
+    db.session.commit()
+
+
+def edit_elsewhere(map_id: int, **values) -> None:
+    # As provision_maps.py and update_maps.py do, from their own process:
+    # no cache version is bumped in the server
+    db.session.execute(Map.__table__.update().where(Map.id == map_id).values(**values))
+    db.session.commit()
+
+
+def test_maps_listing_follows_edits_made_elsewhere(client, map):
+    first = client.get('/api/maps')
+    assert {"id": map.id, "name": 'Workshop'} in first.get_json()
+    edit_elsewhere(map.id, name='Wood shop')
+    second = client.get('/api/maps', headers={'If-None-Match': first.headers['ETag'].strip('"')})
+    assert second.status_code == 200
+    assert {"id": map.id, "name": 'Wood shop'} in second.get_json()
+    # Unchanged maps still answer from the cache
+    assert client.get('/api/maps', headers={'If-None-Match': second.headers['ETag'].strip('"')}).status_code == 304
+
+
+@pytest.mark.parametrize('column, value', [('name', 'Wood shop'), ('background_color', '#fafafa'),
+                                           ('svg_path', '/static/maps/closet.svg')])
+def test_index_follows_map_edits_made_elsewhere(client, map, column, value):
+    first = client.get('/')
+    assert value not in first.get_data(as_text=True)
+    edit_elsewhere(map.id, **{column: value})
+    second = client.get('/', headers={'If-None-Match': first.headers['ETag'].strip('"')})
+    assert second.status_code == 200
+    assert value in second.get_data(as_text=True)
@@ -0,0 +1,139 @@
+# tests/test_pagination.py
+import base64
+import json
+import tracemalloc
+import pytest
+from sqlalchemy import insert
+from app import db
+from models import Item, Map
+from search import search_items
+
+ITEM_COUNT = 100_000
+SEARCH_ITEMS = 30
+
+
+def cursor_for(*key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+@pytest.fixture(scope='module')
+def maps(app):
+    big = Map(name='Big', svg_path='/static/maps/main.svg')
+    small = Map(name='Small', svg_path='/static/maps/closet.svg')
+    db.session.add_all([big, small])
+    db.session.commit()
+    db.session.execute(insert(Item), [
+        {"name": f"part {n}", "tags": "bin", "x_coord": n % 1000, "y_coord": n // 1000, "map_id": big.id}
+        for n in range(ITEM_COUNT)])
+    db.session.execute(insert(Item), [
+        # Extra mentions of "drill" in tags and descriptions vary the scores
+        {"name": f"drill {n}", "tags": "drill tool" if n % 3 == 0 else "tool",
+         "description": "drill bits" if n % 4 == 0 else "", "x_coord": n, "y_coord": n, "map_id": small.id}
+        for n in range(SEARCH_ITEMS)])
+    db.session.commit()
+    yield big.id, small.id
+    db.session.execute(Item.__table__.delete())
+    db.session.execute(Map.__table__.delete())
+    db.session.commit()
+
+
+def fetch(client, url: str):
+    """GET a (possibly streamed) response and read it to the end, so its
+    request context is closed before the next request."""
+    response = client.get(url)
+    response.get_data()
+    response.close()
+    return response
+
+
+def walk(client, url: str) -> list:
+    rows = []
+    while url:
+        response = fetch(client, url)
+        assert response.status_code == 200
+        rows += response.get_json()
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f"{url.split('&cursor=')[0]}&cursor={cursor}" if cursor else None
+    return rows
+
+
+def peak_memory(client, url: str) -> int:
+    tracemalloc.start()
+    try:
+        assert fetch(client, url).status_code == 200
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_item_list_pages_cover_every_item_once(client, maps):
+    rows = walk(client, '/api/itemsList?limit=1000')
+    ids = [row['id'] for row in rows]
+    assert len(ids) == ITEM_COUNT + SEARCH_ITEMS
+    assert ids == sorted(set(ids))
+
+
+def test_map_items_pages_follow_the_cursor(client, maps):
+    big, _ = maps
+    first = fetch(client, f'/api/items?map_id={big}&limit=500&fields=name')
+    second = fetch(client, f"/api/items?map_id={big}&limit=500&fields=name&cursor={first.headers['X-Next-Cursor']}")
+    first_ids = [row['id'] for row in first.get_json()]
+    second_ids = [row['id'] for row in second.get_json()]
+    assert len(first_ids) == len(second_ids) == 500
+    assert first_ids[-1] < second_ids[0]
+    assert 'rel="next"' in second.headers['Link']
+
+
+def test_page_memory_is_flat_across_the_table(client, maps):
+    big, _ = maps
+    last_id = db.session.query(db.func.max(Item.id)).filter(Item.map_id == big).scalar()
+    first = peak_memory(client, f'/api/items?map_id={big}&limit=1000')
+    deep = peak_memory(client, f'/api/items?map_id={big}&limit=1000&cursor={cursor_for(last_id - 1500)}')
+    # A page costs the same wherever it starts, and nowhere near the table
+    assert first < 8 * 1024 * 1024
+    assert deep < first * 1.5
+
+
+def test_search_pages_by_score_and_id(client, maps):
+    _, small = maps
+    rows = walk(client, f'/api/search?map_id={small}&q=drill&limit=7')
+    ids = [row['id'] for row in rows]
+    assert len(ids) == len(set(ids)) == SEARCH_ITEMS
+    # Pages continue the relevance order, not the id order
+    ranked = search_items(small, 'drill')
+    scores = {item.id: score for score, item in ranked}
+    assert ids == [item.id for _, item in ranked]
+    assert ids != sorted(ids)
+    assert all(scores[a] > scores[b] or (scores[a] == scores[b] and a < b) for a, b in zip(ids, ids[1:]))
+
+
+@pytest.mark.parametrize('url', [
+    '/api/itemsList?cursor={}',
+    '/api/maps?cursor={}',
+    '/api/items?map_id=1&cursor={}',
+    '/api/search?map_id=1&q=drill&cursor={}',
+])
+@pytest.mark.parametrize('cursor', [
+    cursor_for('x'),
+    cursor_for('x', 'y'),
+    cursor_for(True),
+    cursor_for(1, 2, 3),
+    cursor_for(),
+    'not-base64!',
+])
+def test_malformed_cursors_are_rejected(client, maps, url, cursor):
+    assert fetch(client, url.format(cursor)).status_code == 400
+
+
+@pytest.mark.parametrize('url', ['/api/itemsList', '/api/maps', '/api/items?map_id=1'])
+def test_id_cursors_need_one_integer(client, maps, url):
+    separator = '&' if '?' in url else '?'
+    assert fetch(client, f'{url}{separator}cursor={cursor_for(1.5)}').status_code == 400
+    assert fetch(client, f'{url}{separator}cursor={cursor_for(1, 2)}').status_code == 400
+    assert fetch(client, f'{url}{separator}cursor={cursor_for(1)}').status_code == 200
+
+
+def test_search_cursors_need_score_and_id(client, maps):
+    _, small = maps
+    assert fetch(client, f'/api/search?map_id={small}&q=drill&cursor={cursor_for(1.0)}').status_code == 400
+    assert fetch(client, f'/api/search?map_id={small}&q=drill&cursor={cursor_for(1.0, 2)}').status_code == 200
@@ -0,0 +1,46 @@
+# tests/test_tiles.py
+import os
+from types import SimpleNamespace
+from PIL import Image
+from app import db
+from models import Map
+from tiles import ingest_map, tile_root
+
+
+def write_map(static_folder: str, color) -> None:
+    os.makedirs(os.path.join(static_folder, 'maps'), exist_ok=True)
+    Image.new('RGB', (300, 200), color).save(os.path.join(static_folder, 'maps', 'floor.png'))
+
+
+def test_ingest_keeps_previous_tile_version(tmp_path):
+    static_folder = str(tmp_path)
+    map = SimpleNamespace(id=1, svg_path='/static/maps/floor.svg', tile_version=None)
+    versions = []
+    for color in ('white', 'gray', 'black'):
+        write_map(static_folder, color)
+        versions.append(ingest_map(map, static_folder)['version'])
+        assert map.tile_version == versions[-1]
+    assert len(set(versions)) == 3
+    # Pages loaded before the last ingest still link the version before it
+    assert sorted(os.listdir(tile_root(static_folder, map.id))) == sorted(versions[1:])
+    assert os.path.isfile(os.path.join(tile_root(static_folder, map.id), versions[1], '0', '0', '0.webp'))
+
+
+def test_index_follows_tile_version_changed_elsewhere(client):
+    map = Map(name='Tiled', svg_path='/static/maps/main.svg', tile_size=256, tile_max_zoom=2,
+              tile_width=900, tile_height=600, tile_version='aaaa')
+    db.session.add(map)
+    db.session.commit()
+    try:
+        first = client.get('/')
+        assert f'/tiles/{map.id}/aaaa/' in first.get_data(as_text=True)
+        # As ingest_maps.py does from its own process: no cache version is bumped
+        db.session.execute(Map.__table__.update().where(Map.id == map.id).values(tile_version='bbbb'))
+        db.session.commit()
+        second = client.get('/', headers={'If-None-Match': first.headers['ETag'].strip('"')})
+        assert second.status_code == 200
+        body = second.get_data(as_text=True)
+        assert f'/tiles/{map.id}/bbbb/' in body and '/aaaa/' not in body
+    finally:
+        db.session.delete(db.session.get(Map, map.id))
+        db.session.commit()
@@ -0,0 +1,90 @@
+# tests/test_uploads.py
+import errno
+import io
+import os
+import time
+import pytest
+from flask import request
+from PIL import Image
+import blobstore
+from app import db
+from models import Item, Map
+
+
+@pytest.fixture
+def folders(app, tmp_path, monkeypatch):
+    public = tmp_path / 'thumbnails'
+    staging = tmp_path / 'instance' / 'uploads'
+    public.mkdir()
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(public))
+    monkeypatch.setitem(app.config, 'UPLOAD_STAGING_FOLDER', str(staging))
+    return public, staging
+
+
+def png_bytes(color='red') -> bytes:
+    out = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(out, 'PNG')
+    return out.getvalue()
+
+
+def test_staging_folder_defaults_to_instance_path(app):
+    assert app.config['UPLOAD_STAGING_FOLDER'] == os.path.join(app.instance_path, 'uploads')
+
+
+def test_upload_parts_are_staged_outside_the_upload_folder(app, folders):
+    public, staging = folders
+    with app.test_request_context('/', method='POST', data={"image": (io.BytesIO(png_bytes()), 'a.png')}):
+        path = request.files['image'].stream.name
+        assert os.path.dirname(path) == str(staging)
+        assert os.listdir(public) == []
+    assert not os.path.exists(path)
+
+
+def test_item_image_is_moved_into_the_store(client, folders):
+    public, staging = folders
+    map = Map(name='Uploads', svg_path='/static/maps/main.svg')
+    db.session.add(map)
+    db.session.flush()
+    item = Item(name='vise', tags='', x_coord=1, y_coord=1, map_id=map.id)
+    db.session.add(item)
+    db.session.commit()
+    try:
+        response = client.put(f'/api/items/{item.id}', data={"image": (io.BytesIO(png_bytes()), 'vise.png')})
+        assert response.get_json()['image_pending']
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            db.session.expire_all()
+            if db.session.get(Item, item.id).image_path:
+                break
+            time.sleep(0.05)
+        image_path = db.session.get(Item, item.id).image_path
+        assert image_path and os.path.isfile(public / os.path.basename(image_path))
+        assert not [name for name in os.listdir(public) if name.endswith('.part')]
+        assert os.listdir(staging) == []
+    finally:
+        db.session.delete(db.session.get(Item, item.id))
+        db.session.delete(map)
+        db.session.commit()
+
+
+def test_store_file_copies_across_filesystems(tmp_path, monkeypatch):
+    public = tmp_path / 'thumbnails'
+    staging = tmp_path / 'staging'
+    public.mkdir()
+    staging.mkdir()
+    source = staging / 'upload.part'
+    source.write_bytes(b'photo')
+    real_replace = os.replace
+
+    def replace(src, dst):
+        # Only the rename out of the staging folder crosses a device
+        if os.path.dirname(src) == str(staging):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        real_replace(src, dst)
+
+    monkeypatch.setattr(blobstore.os, 'replace', replace)
+    filename, created = blobstore.store_file(str(source), '.jpg', str(public))
+    assert created
+    assert (public / filename).read_bytes() == b'photo'
+    assert os.listdir(public) == [filename]
+    assert not source.exists()
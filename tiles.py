@@ -0,0 +1,146 @@
+# tiles.py
+import hashlib
+import io
+import math
+import os
+import re
+import shutil
+from PIL import Image
+from images import WEBP_QUALITY
+
+TILE_DIR = 'tiles'
+TILE_SIZE = 256
+
+
+def _cairosvg():
+    try:
+        import cairosvg
+    except ImportError:
+        return None
+    return cairosvg
+
+
+def minify_svg(text: str) -> str:
+    """Drop comments, editor metadata and formatting whitespace. Text
+    content and attribute values are left alone."""
+    text = re.sub(r'<!--.*?-->', '', text, flags=re.S)
+    text = re.sub(r'<metadata\b.*?</metadata>', '', text, flags=re.S)
+    # Whitespace inside <style> blocks
+    text = re.sub(r'(<style[^>]*>)(.*?)(</style>)',
+                  lambda m: m.group(1) + re.sub(r'\s*([{};:,])\s*', r'\1', ' '.join(m.group(2).split()))
+                  .replace(';}', '}') + m.group(3),
+                  text, flags=re.S)
+    # Indentation between tags (text nodes with content are kept)
+    text = re.sub(r'>\s+<', '><', text)
+    return text.strip() + '\n'
+
+
+def svg_file(static_folder: str, svg_path: str) -> str:
+    relative_path = svg_path.lstrip('/')
+    if relative_path.startswith('static/'):
+        relative_path = relative_path[len('static/'):]
+    if '..' in relative_path.split('/'):
+        raise ValueError(f"invalid map path {svg_path}")
+    return os.path.join(static_folder, relative_path)
+
+
+def render_source(svg_file_path: str) -> Image.Image:
+    """Rasterize a map at the size of its PNG sibling, which is what the
+    client draws and what item coordinates are measured against. Without
+    cairosvg the PNG itself is used."""
+    png_path = os.path.splitext(svg_file_path)[0] + '.png'
+    size = None
+    if os.path.exists(png_path):
+        with Image.open(png_path) as png:
+            size = png.size
+    cairosvg = _cairosvg()
+    if cairosvg and os.path.exists(svg_file_path):
+        kwargs = {"output_width": size[0], "output_height": size[1]} if size else {}
+        data = cairosvg.svg2png(url=svg_file_path, **kwargs)
+        return Image.open(io.BytesIO(data)).convert('RGBA')
+    if size is None:
+        raise ValueError(f"no raster for {svg_file_path}; install cairosvg or add a PNG")
+    with Image.open(png_path) as png:
+        return png.convert('RGBA')
+
+
+def max_zoom_for(width: int, height: int, tile_size: int = TILE_SIZE) -> int:
+    return max(0, math.ceil(math.log2(max(width, height) / tile_size)))
+
+
+def build_pyramid(image: Image.Image, output_dir: str, tile_size: int = TILE_SIZE) -> int:
+    """Write XYZ WebP tiles as <output_dir>/<z>/<x>/<y>.webp. The deepest
+    level is the image at full size and each level above halves it, down
+    to zoom 0 fitting in one tile. Edge tiles are cropped, not padded.
+    Returns the maximum zoom."""
+    max_zoom = max_zoom_for(*image.size, tile_size)
+    level = image
+    for z in range(max_zoom, -1, -1):
+        if z < max_zoom:
+            level = level.resize((max(1, math.ceil(level.width / 2)), max(1, math.ceil(level.height / 2))),
+                                 Image.LANCZOS)
+        for x in range(math.ceil(level.width / tile_size)):
+            column_dir = os.path.join(output_dir, str(z), str(x))
+            os.makedirs(column_dir, exist_ok=True)
+            for y in range(math.ceil(level.height / tile_size)):
+                tile = level.crop((x * tile_size, y * tile_size,
+                                   min((x + 1) * tile_size, level.width), min((y + 1) * tile_size, level.height)))
+                tile.save(os.path.join(column_dir, f"{y}.webp"), 'WEBP', quality=WEBP_QUALITY, method=6)
+    return max_zoom
+
+
+def tile_root(static_folder: str, map_id: int) -> str:
+    return os.path.join(static_folder, TILE_DIR, str(map_id))
+
+
+def ingest_map(map, static_folder: str, tile_size: int = TILE_SIZE) -> dict:
+    """Minify the map's SVG in place, rebuild its tile pyramid under a
+    content-versioned directory and record the tile metadata on the Map.
+    The caller commits. Returns the bytes saved by minification."""
+    path = svg_file(static_folder, map.svg_path)
+    saved = 0
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            original = f.read()
+        minified = minify_svg(original)
+        if len(minified) < len(original):
+            with open(path + '.part', 'w', encoding='utf-8') as f:
+                f.write(minified)
+            os.replace(path + '.part', path)
+            saved = len(original.encode('utf-8')) - len(minified.encode('utf-8'))
+
+    image = render_source(path)
+    version = hashlib.sha256(image.tobytes() + repr((image.size, tile_size)).encode()).hexdigest()[:16]
+    root = tile_root(static_folder, map.id)
+    output_dir = os.path.join(root, version)
+    if not os.path.isdir(output_dir):
+        staging = output_dir + '.part'
+        shutil.rmtree(staging, ignore_errors=True)
+        build_pyramid(image, staging, tile_size)
+        os.replace(staging, output_dir)
+    # The previous version stays until the next ingest, for pages that
+    # were loaded before this one; anything older is dropped
+    keep = {version, map.tile_version}
+    for name in os.listdir(root):
+        if name not in keep:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    map.tile_size = tile_size
+    map.tile_max_zoom = max_zoom_for(*image.size, tile_size)
+    map.tile_width, map.tile_height = image.size
+    map.tile_version = version
+    return {"svg_bytes_saved": saved, "width": image.width, "height": image.height,
+            "max_zoom": map.tile_max_zoom, "version": version}
+
+
+def tile_info(map):
+    """Tile metadata for the client, or None when the map has no tiles."""
+    if not map.tile_version:
+        return None
+    return {
+        "url": f"/tiles/{map.id}/{map.tile_version}/{{z}}/{{x}}/{{y}}.webp",
+        "tile_size": map.tile_size,
+        "max_zoom": map.tile_max_zoom,
+        "width": map.tile_width,
+        "height": map.tile_height,
+    }
@@ -0,0 +1,170 @@
+# uploads.py
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from flask import Request, current_app
+from werkzeug.utils import secure_filename
+from PIL import Image
+from app import db
+from models import Item
+from images import generate_variants, has_variants, variant_urls
+from events import item_changed
+from manifest import image_index
+import blobstore
+
+_executor = None
+_executor_lock = threading.Lock()
+# Latest submission per item, so a slow job can't overwrite a newer image
+_latest_submission = {}
+_submission_lock = threading.Lock()
+
+
+def staging_folder() -> str:
+    """Where uploads are written until they are complete. It is outside the
+    static folder, so a partial file can't be fetched by URL."""
+    folder = current_app.config['UPLOAD_STAGING_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+class StreamingUploadRequest(Request):
+    """Spools every uploaded file part straight to a temp file in the
+    staging folder as chunks arrive, so the finished upload can be renamed
+    into the blob store without being buffered in memory or copied again."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = tempfile.NamedTemporaryFile(dir=staging_folder(), suffix='.part', delete=False)
+        self.upload_temp_paths.append(stream.name)
+        return stream
+
+    @property
+    def upload_temp_paths(self) -> list:
+        return self.__dict__.setdefault('_upload_temp_paths', [])
+
+    def close(self):
+        super().close()
+        for path in self.upload_temp_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def claim_upload(request, file) -> Optional[str]:
+    """Take ownership of an uploaded file's temp path so it survives the request."""
+    file.stream.flush()
+    path = getattr(file.stream, 'name', None)
+    if path in request.upload_temp_paths:
+        request.upload_temp_paths.remove(path)
+        return path
+    # Not spooled by StreamingUploadRequest (e.g. the test client); copy it out
+    fd, path = tempfile.mkstemp(dir=staging_folder(), suffix='.part')
+    with os.fdopen(fd, 'wb') as out:
+        file.stream.seek(0)
+        while chunk := file.stream.read(blobstore.CHUNK_SIZE):
+            out.write(chunk)
+    return path
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('UPLOAD_WORKERS', 2),
+                thread_name_prefix='upload')
+        return _executor
+
+
+def store_item_image(path: str, extension: str, upload_folder: str) -> tuple:
+    """Validate the image at path, move it into the blob store and make sure
+    its thumbnails exist. Returns (image_path, image_variants)."""
+    try:
+        with Image.open(path) as image:
+            image.verify()
+            if image.format:
+                # Trust the decoded format over the client's filename
+                extension = blobstore.normalize_extension(f"image.{image.format}")
+    except Exception:
+        os.remove(path)
+        raise
+
+    filename, created = blobstore.store_file(path, extension, upload_folder)
+    if created:
+        image_index.invalidate()
+    blob_path = os.path.join(upload_folder, filename)
+    if not created and has_variants(blob_path, upload_folder):
+        return f'/static/thumbnails/{filename}', variant_urls(os.path.splitext(filename)[0], '/static/thumbnails')
+
+    variants = None
+    try:
+        variants = generate_variants(blob_path, upload_folder, '/static/thumbnails')
+        image_index.invalidate()
+    except Exception as e:
+        current_app.logger.warning(
+            f"Could not generate thumbnails for {blob_path}: {str(e)}")
+    return f'/static/thumbnails/{filename}', variants
+
+
+def _process_item_image(app, item_id: int, submission: int, path: str, extension: str):
+    try:
+        _apply_item_image(app, item_id, submission, path, extension)
+    finally:
+        with _submission_lock:
+            if _latest_submission.get(item_id) == submission:
+                del _latest_submission[item_id]
+
+
+def _apply_item_image(app, item_id: int, submission: int, path: str, extension: str):
+    with app.app_context():
+        upload_folder = app.config['UPLOAD_FOLDER']
+        try:
+            image_path, variants = store_item_image(path, extension, upload_folder)
+        except Exception as e:
+            app.logger.error(f"Rejected image upload for item {item_id}: {str(e)}")
+            return
+
+        with _submission_lock:
+            superseded = _latest_submission.get(item_id) != submission
+        item = db.session.get(Item, item_id)
+        if item is None or superseded:
+            app.logger.info(f"Discarding stale image upload for item {item_id}")
+            if blobstore.release(image_path, upload_folder):
+                image_index.invalidate()
+            return
+
+        previous_image_path = item.image_path
+        item.image_path = image_path
+        item.image_variants = variants
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error saving image for item {item_id}: {str(e)}")
+            if blobstore.release(image_path, upload_folder):
+                image_index.invalidate()
+            return
+        item_changed('updated', item.id, item.revision, item.map_id)
+        app.logger.info(f"Processed image for item {item_id}: {image_path}")
+        if previous_image_path != image_path and blobstore.release(previous_image_path, upload_folder):
+            image_index.invalidate()
+
+
+def submit_item_image(request, item_id: int, file):
+    """Hand an uploaded image to the worker pool; the item row is updated
+    once the image has been validated, stored and thumbnailed."""
+    path = claim_upload(request, file)
+    extension = blobstore.normalize_extension(secure_filename(file.filename or ''))
+    return submit_image_file(item_id, path, extension)
+
+
+def submit_image_file(item_id: int, path: str, extension: str):
+    """Like submit_item_image, for a temp file already in the staging folder.
+    The worker takes ownership of path."""
+    with _submission_lock:
+        submission = _latest_submission.get(item_id, 0) + 1
+        _latest_submission[item_id] = submission
+    app = current_app._get_current_object()
+    return _get_executor().submit(_process_item_image, app, item_id, submission, path, extension)
@@ -1,9 +1,15 @@
+from app import db
 from models import Item
 from flask import current_app
 
-def list_available_items():
+def list_available_items(limit=None, after_id=None):
     try:
-        items = Item.query.all()
+        query = db.session.query(Item.id, Item.name, Item.tags, Item.description).order_by(Item.id)
+        if after_id is not None:
+            query = query.filter(Item.id > int(after_id))
+        if limit is not None:
+            query = query.limit(limit)
+        items = query.all()
         item_list = [{"id": item.id, "name": item.name, "tags": item.tags, "description": item.description} for item in items]
         return item_list
     except Exception as e: